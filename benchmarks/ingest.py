@@ -0,0 +1,106 @@
+"""
+Benchmark of the JHU CSV ingest: bulk parser vs the original row loop
+
+Run from the top level directory:
+
+    python -m benchmarks.ingest [-counties N] [-days N] [-repeat N]
+"""
+
+import argparse
+import csv
+
+import numpy as np
+
+import benchmarks.synthetic as synthetic
+import benchmarks.timing as timing
+import support.jhu_data as jhu
+import support.states as states
+
+
+def legacy_parse(text):
+    """
+    The original download_data loop: csv.reader with one np.array per row
+    and a new state total allocated by np.add for every county
+    """
+    reader = csv.reader(iter(text.splitlines()), delimiter=',', quotechar='"')
+    columns = next(reader)
+    dates = np.array(columns[56:])
+
+    nraw   = dates.size
+    ndays  = dates.size - 1
+    nweeks = int(ndays/7)
+
+    raw_state, daily_state, weekly_state = dict(), dict(), dict()
+    county_data = dict()
+
+    def add(sd, state, data):
+        sd[state] = data if state not in sd else np.add(sd[state],data)
+
+    for row in reader:
+        if row[7] != 'US':
+            continue
+        state = row[6]
+        if state not in states.us_state_abbrev:
+            continue
+        state = states.us_state_abbrev[state]
+
+        raw    = np.array(row[-nraw:],dtype=int)
+        daily  = raw[1:] - raw[:-1]
+        weekly = raw[-1-7*nweeks::7]
+        weekly = weekly[1:] - weekly[:-1]
+
+        add(raw_state,state,raw)
+        add(daily_state,state,daily)
+        add(weekly_state,state,weekly)
+        county_data[(state,row[5])] = (raw,daily,weekly)
+
+    return raw_state, daily_state, weekly_state, county_data
+
+
+def bulk_parse(text):
+    """jhu_data.parse_csv plus the state totals it replaces"""
+    data = jhu.parse_csv(text)
+    for regional in [data.raw, data.daily, data.weekly]:
+        regional.state.matrix
+    return data
+
+
+def check(text):
+    """Verifies that both parsers produce the same state and county data"""
+    raw_state, daily_state, weekly_state, county_data = legacy_parse(text)
+    data = jhu.parse_csv(text)
+
+    for regional, legacy in [(data.raw,raw_state),
+                             (data.daily,daily_state),
+                             (data.weekly,weekly_state)]:
+        for state in legacy:
+            assert np.array_equal(regional.state[state], legacy[state]), state
+
+    for (state,county),(raw,daily,weekly) in county_data.items():
+        assert np.array_equal(data.raw.county[state][county], raw)
+        assert np.array_equal(data.weekly.county[state][county], weekly)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-counties', type=int, default=3200, metavar='N')
+    parser.add_argument('-days', type=int, default=1000, metavar='N')
+    parser.add_argument('-repeat', type=int, default=3, metavar='N')
+    args = parser.parse_args()
+
+    text = synthetic.generate_csv('confirmed', args.counties, args.days)
+    print("Synthetic CSV: {} counties x {} days ({:.1f} MB)".format(
+        args.counties, args.days, len(text)/1e6))
+
+    check(text)
+
+    legacy = timing.best_time(lambda: legacy_parse(text), args.repeat)
+    bulk   = timing.best_time(lambda: bulk_parse(text), args.repeat)
+
+    print("  row loop:    {:7.3f}s".format(legacy))
+    print("  bulk parser: {:7.3f}s".format(bulk))
+    print("  speedup:     {:7.1f}x".format(legacy/bulk))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of county smoothing: one np.convolve per county vs support.smoothing
+
+Run from the top level directory:
+
+    python -m benchmarks.smoothing [-counties N] [-days N] [-window N] [-repeat N]
+"""
+
+import argparse
+import re
+
+import numpy as np
+
+import benchmarks.synthetic as synthetic
+import benchmarks.timing as timing
+import support.jhu_data as jhu
+import support.smoothing as smoothing
+
+
+def per_county(block, window):
+    """The original get_county_data loop: one np.convolve per county"""
+    c = np.ones(window)/window
+    return [ np.convolve(data, c, mode='valid') for data in block ]
+
+
+def per_county_states(data, window):
+    """The original get_county_data loop for every state (without per-capita)"""
+    c = np.ones(window)/window
+    rval = dict()
+    for state, cd in data.daily.county.items():
+        rval[state] = dict()
+        for county, series in cd.items():
+            if re.match('^Out of',county) or county == 'Unassigned':
+                continue
+            rval[state][county] = np.convolve(series, c, mode='valid')
+    return rval
+
+
+def vectorized_states(data, window):
+    """JHUData.derive_county_data for every state"""
+    jhu_data = jhu.JHUData()
+    jhu_data['confirmed'] = data
+    return { state : jhu_data.derive_county_data(
+                 state, 'confirmed', 'daily', window, None, 'trailing')
+             for state in data.state_codes }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-counties', type=int, default=3200, metavar='N')
+    parser.add_argument('-days', type=int, default=1000, metavar='N')
+    parser.add_argument('-window', type=int, default=7, metavar='N')
+    parser.add_argument('-repeat', type=int, default=3, metavar='N')
+    args = parser.parse_args()
+
+    data  = jhu.parse_csv(synthetic.generate_csv('confirmed', args.counties, args.days))
+    block = data.daily.county.matrix
+
+    print("Daily county matrix: {} x {}, {}-day window".format(*block.shape, args.window))
+
+    expected = np.array(per_county(block, args.window))
+    for kernel in ['trailing','centered']:
+        assert np.array_equal(smoothing.smooth(block, args.window, kernel), expected), kernel
+
+    loop = timing.best_time(lambda: per_county(block, args.window), args.repeat)
+    print("  np.convolve per county:  {:7.3f}s".format(loop))
+
+    for kernel in smoothing.kernels:
+        t = timing.best_time(lambda: smoothing.smooth(block, args.window, kernel), args.repeat)
+        print("  smooth ({:11s}):    {:7.3f}s  ({:.1f}x)".format(kernel, t, loop/t))
+
+    print("Smoothed county series of every state (get_county_data)")
+
+    old = per_county_states(data, args.window)
+    new = vectorized_states(data, args.window)
+    for state in old:
+        for county in old[state]:
+            assert np.array_equal(old[state][county], new[state][county]), (state,county)
+
+    loop = timing.best_time(lambda: per_county_states(data, args.window), args.repeat)
+    vect = timing.best_time(lambda: vectorized_states(data, args.window), args.repeat)
+    print("  per county loop:         {:7.3f}s".format(loop))
+    print("  derive_county_data:      {:7.3f}s  ({:.1f}x)".format(vect, loop/vect))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of import and start-up times of the support modules
+
+Each module is imported in a fresh interpreter with -X importtime so that
+the cumulative import time (including everything it pulls in) is measured
+without interference from modules that are already loaded.  The census
+load is timed both from the text file (as load_data used to do it) and
+from the compiled binary file.
+
+Run from the top level directory:
+
+    python -m benchmarks.startup [-repeat N] [-json file] [-compare file]
+
+-json saves the results and -compare reports any time that grew by more
+than 25% (and at least 2 ms) relative to a previously saved file (see
+benchmarks.timing).
+"""
+
+import argparse
+import subprocess
+import sys
+
+import benchmarks.timing as timing
+
+modules = [
+    'support.args',
+    'support.states',
+    'support.counties',
+    'support.util',
+    'support.sources',
+    'support.jhu_data',
+]
+
+census_text = '''
+import time
+import support.states as states
+start = time.perf_counter()
+counties = {}
+with open('data/co-est2019-annres.dat') as fp:
+    for line in fp:
+        county,state,pop = line.strip().split('|')
+        state = states.us_state_abbrev[state]
+        counties.setdefault(state,{})[county] = int(pop)
+print(time.perf_counter() - start)
+'''
+
+census_compiled = '''
+import time
+import support.counties as counties
+counties.census()
+start = time.perf_counter()
+counties.load_data()
+print(time.perf_counter() - start)
+'''
+
+
+def import_time(module):
+    """Cumulative import time of module (in seconds) in a fresh interpreter"""
+    rq = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True)
+
+    for line in rq.stderr.splitlines():
+        fields = [ x.strip() for x in line.split('|') ]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) * 1e-6
+
+    raise RuntimeError("No import time reported for " + module)
+
+
+def script_time(script):
+    """Time printed by script when run in a fresh interpreter"""
+    rq = subprocess.run(
+        [sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return float(rq.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-repeat', type=int, default=5, metavar='N')
+    parser.add_argument('-json', metavar='file', help='Save the results to file')
+    parser.add_argument('-compare', metavar='file', help='Compare with saved results')
+    args = parser.parse_args()
+
+    times = dict()
+    for module in modules:
+        times['import ' + module] = min(import_time(module) for _ in range(args.repeat))
+    times['census from text']     = min(script_time(census_text) for _ in range(args.repeat))
+    times['census from compiled'] = min(script_time(census_compiled) for _ in range(args.repeat))
+
+    baseline = dict()
+    if args.compare:
+        _, baseline = timing.load(args.compare)
+
+    results = dict()
+    regressions = 0
+    for name, t in times.items():
+        results[name] = dict(seconds=t)
+        change, n = timing.compare(results[name], baseline.get(name))
+        regressions += n
+        print("  {:28s} {:8.2f} ms".format(name, 1000*t) + change)
+
+    if args.json:
+        timing.save(args.json, results)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Benchmark suite of the ingest, transform and render stages
+
+Every stage runs on synthetic JHU files (see benchmarks.synthetic), so the
+suite runs offline and at any scale.  Each stage is timed -repeat times
+(the best time is reported) and run once more under tracemalloc to find
+its peak memory (above what was allocated before the stage started).
+
+Run from the top level directory:
+
+    python -m benchmarks.suite [-counties N] [-days N] [-repeat N]
+                               [-stages name ...] [-json file] [-compare file]
+
+-json saves the results and -compare reports any time or peak memory that
+grew by more than 25% (and at least 2 ms or 1 MB) relative to a previously
+saved file (see benchmarks.timing).  The exit status is 1 if there are any
+such regressions.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import benchmarks.synthetic as synthetic
+import benchmarks.timing as timing
+import support.args
+import support.figures as figures
+import support.jhu_data as jhu
+import support.sources as sources
+import support.util as su
+
+from contextlib import redirect_stdout
+
+
+def jhu_data(data):
+    """JHUData (with an empty derived cache) holding the given data sets"""
+    rval = jhu.JHUData()
+    rval.update(data)
+    return rval
+
+
+def plot(module, argv, data):
+    """Renders a plot into a temporary file (without the plotter's messages)"""
+    from importlib import import_module
+
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(io.StringIO()):
+        args = support.args.Args(argv + ['-rerender', '-save', os.path.join(tmp,'plot.png')])
+        import_module('plotters.' + module).plot(args, jhu_data(data))
+
+
+def stages(text, tmp):
+    """
+    Returns a dict of stages by name, each a (setup, run) pair of functions
+    where run is passed whatever setup returns (and only run is measured)
+    """
+    data = dict(confirmed=jhu.parse_csv(text['confirmed']),
+                deaths=jhu.parse_csv(text['deaths']))
+    cache = os.path.join(tmp, 'confirmed')
+    data['confirmed'].save(cache)
+
+    states = data['confirmed'].state_codes
+    big    = max(states, key=lambda x: len(data['confirmed'].raw.county[x]))
+
+    def all_states(func):
+        def run(jd):
+            for state in states:
+                func(jd, state)
+        return run
+
+    def no_setup():
+        return None
+
+    def fresh_data():
+        return jhu_data(data)
+
+    def chunks(data_type):
+        raw = text[data_type].encode('utf-8')
+        return lambda: [ raw[i:i+sources.chunk_size]
+                         for i in range(0, len(raw), sources.chunk_size) ]
+
+    def load_cache(_):
+        loaded = jhu.DataSet.load(cache)
+        loaded.counts.sum()     # touch every page of the memory map
+
+    def map_variants():
+        figures.pool.clear()
+        plot('map', ['map'], data)
+
+    return {
+        'parse confirmed' : (chunks('confirmed'), lambda x: jhu.parse_stream(x)),
+        'parse deaths'    : (chunks('deaths'), lambda x: jhu.parse_stream(x)),
+        'cache save'      : (no_setup, lambda _: data['confirmed'].save(os.path.join(tmp,'save'))),
+        'cache load'      : (no_setup, load_cache),
+        'state totals'    : (fresh_data, all_states(
+            lambda jd, s: jd.get_state_data(s, 'confirmed', 'daily'))),
+        'smoothing'       : (fresh_data, all_states(
+            lambda jd, s: jd.get_county_data(s, 'confirmed', 'daily', 7))),
+        'per capita'      : (fresh_data, all_states(
+            lambda jd, s: jd.get_county_data(s, 'confirmed', 'daily', 7, 'per_capita'))),
+        'dates'           : (no_setup, lambda _: (
+            su.x_values(data['confirmed'].dates), su.timespan(data['confirmed'].dates))),
+        'render map'      : (figures.pool.clear, lambda _: plot('map', ['map'], data)),
+        'render map (pooled)' : (map_variants, lambda _: plot('map', ['map','-percapita'], data)),
+        'render counties' : (figures.pool.clear, lambda _: plot('counties', ['counties',big], data)),
+        'render counties (fast)' : (figures.pool.clear, lambda _: plot('counties', ['counties',big,'-fast'], data)),
+        'render heatmap'  : (no_setup, lambda _: plot('heatmap', ['heatmap','-percapita'], data)),
+    }
+
+
+def measure(setup, run, repeat):
+    """
+    Returns the best time (seconds) and the peak memory (MB) of run, whose
+    output (e.g. warnings about the synthetic counties) is discarded
+    """
+    with redirect_stdout(io.StringIO()):
+        best = timing.best_time(run, repeat, setup)
+
+    x = setup()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    with redirect_stdout(io.StringIO()):
+        run(x)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    return best, peak/1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-counties', type=int, default=3200, metavar='N')
+    parser.add_argument('-days', type=int, default=500, metavar='N')
+    parser.add_argument('-repeat', type=int, default=3, metavar='N')
+    parser.add_argument('-stages', nargs='+', metavar='name', help='Only run these stages')
+    parser.add_argument('-json', metavar='file', help='Save the results to file')
+    parser.add_argument('-compare', metavar='file', help='Compare with saved results')
+    args = parser.parse_args()
+
+    su.use_backend(False)
+
+    text = { dt : synthetic.generate_csv(dt, args.counties, args.days) for dt in jhu.data_types }
+    print("Synthetic CSV: {} counties x {} days ({:.1f} MB confirmed)".format(
+        args.counties, args.days, len(text['confirmed'])/1e6))
+
+    baseline = dict()
+    if args.compare:
+        params, baseline = timing.load(args.compare)
+        if (params['counties'], params['days']) != (args.counties, args.days):
+            print("Note: {} was run with {} counties x {} days".format(
+                args.compare, params['counties'], params['days']))
+
+    results = dict()
+    regressions = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (setup, run) in stages(text, tmp).items():
+            if args.stages and name not in args.stages:
+                continue
+
+            seconds, peak_mb = measure(setup, run, args.repeat)
+            results[name] = dict(seconds=seconds, peak_mb=peak_mb)
+
+            change, n = timing.compare(results[name], baseline.get(name))
+            regressions += n
+            print("  {:22s} {:9.2f} ms {:9.1f} MB".format(name, 1000*seconds, peak_mb) + change)
+
+    if args.json:
+        timing.save(args.json, results, counties=args.counties, days=args.days)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
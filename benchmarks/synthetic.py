@@ -0,0 +1,90 @@
+"""
+Generator for synthetic JHU time series CSV files
+
+The files have the same layout as the JHU US time series (including the
+quoted Combined_Key column, the 'Out of XX' and 'Unassigned' rows, a
+territory that is not in support.states, and the Population column of the
+deaths file) so that the ingest code can be exercised offline and at any
+scale.
+
+This file can be imported and contains the following functions:
+
+    * generate_csv - returns the text of a synthetic time series CSV
+    * write_csv    - writes a synthetic time series CSV to a file
+"""
+
+import datetime
+import numpy as np
+
+import support.states as states
+
+HEADER = ['UID','iso2','iso3','code3','FIPS','Admin2','Province_State',
+          'Country_Region','Lat','Long_','Combined_Key']
+
+def date_strings(ndays, first=datetime.date(2020,1,22)):
+    """Dates in the JHU column header format (m/d/yy)"""
+    rval = []
+    for i in range(ndays):
+        d = first + datetime.timedelta(days=i)
+        rval.append(f'{d.month}/{d.day}/{d.year%100}')
+    return rval
+
+def regions(ncounties):
+    """
+    Returns a list of (fips, county, state name, population) tuples
+
+    The counties are spread evenly over the states.  Each state also gets
+    an 'Out of XX' and an 'Unassigned' row (as in the JHU data) and a
+    territory that is not in support.states is added at the end.
+    """
+    state_names = list(states.us_state_abbrev.keys())
+    rng = np.random.default_rng(0)
+
+    rval = []
+    for i in range(ncounties):
+        s = i % len(state_names)
+        fips = 1000*(s+1) + 2*(i//len(state_names)) + 1
+        pop  = int(rng.lognormal(10.5,1.3)) + 100
+        rval.append((float(fips), f'County {i:04d}', state_names[s], pop))
+
+    for s,name in enumerate(state_names):
+        abbrev = states.us_state_abbrev[name]
+        rval.append((float(80000+s+1), f'Out of {abbrev}', name, 0))
+        rval.append((float(90000+s+1), 'Unassigned', name, 0))
+
+    rval.append((60.0, '', 'American Samoa', 55641))
+
+    return rval
+
+def generate_csv(data_type='confirmed', ncounties=3200, ndays=500, seed=1):
+    """
+    Returns the text of a synthetic JHU time series for the given data type
+    """
+    rng = np.random.default_rng(seed)
+    rate = 0.0005 if data_type == 'confirmed' else 0.00002
+
+    header = list(HEADER)
+    if data_type == 'deaths':
+        header.append('Population')
+
+    lines = [ ','.join(header + date_strings(ndays)) ]
+
+    wave = 1 + np.sin(np.arange(ndays)/40.)
+    for i,(fips,county,state,pop) in enumerate(regions(ncounties)):
+        daily  = rng.poisson(rng.gamma(2,rate) * max(pop,1000) * wave)
+        counts = np.cumsum(daily)
+        key    = ', '.join(x for x in [county,state,'US'] if x)
+        row = [ str(84000000+i), 'US', 'USA', '840', str(fips), county, state,
+                'US', '38.1', '-77.2', f'"{key}"' ]
+        if data_type == 'deaths':
+            row.append(str(pop))
+        lines.append(','.join(row + [ str(x) for x in counts ]))
+
+    return '\n'.join(lines) + '\n'
+
+def write_csv(filename, data_type='confirmed', ncounties=3200, ndays=500, seed=1):
+    """
+    Writes a synthetic JHU time series for the given data type to filename
+    """
+    with open(filename,'w') as fp:
+        fp.write(generate_csv(data_type, ncounties, ndays, seed))
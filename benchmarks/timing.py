@@ -0,0 +1,75 @@
+"""
+Timing and regression checks shared by the benchmarks
+
+This file can be imported and contains the following functions:
+
+    * best_time - best time of several runs of a function
+    * save      - writes the results of a benchmark to a JSON file (-json)
+    * load      - reads the results written by save (-compare)
+    * compare   - reports the change of a result relative to a saved one
+
+The JSON files hold the parameters of the run (e.g. the number of
+counties) and, under 'stages', the measurements (seconds, peak_mb) of
+each stage by name.  A measurement is a regression if it grew by more
+than 25% (threshold) and by at least its floor (2 ms or 1 MB).
+"""
+
+import json
+import time
+
+threshold = 1.25
+floors    = dict(seconds=0.002, peak_mb=1.0)
+
+
+def best_time(func, repeat, setup=None):
+    """
+    Returns the best time (seconds) of repeat calls of func
+
+    If setup is given, it is called (untimed) before each call and what it
+    returns is passed to func.
+    """
+    rval = None
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        rval = elapsed if rval is None else min(rval,elapsed)
+    return rval
+
+
+def save(filename, stages, **params):
+    """Writes the measurements of each stage and the parameters of the run"""
+    with open(filename,'w') as fp:
+        json.dump(dict(params, stages=stages), fp, indent=2)
+
+
+def load(filename):
+    """Returns the parameters and the stages saved in filename"""
+    with open(filename) as fp:
+        saved = json.load(fp)
+    stages = saved.pop('stages')
+    return saved, stages
+
+
+def compare(result, old):
+    """
+    Returns the change of each measurement in result relative to old (the
+    saved result of the same stage, or None) as text, along with the
+    number of regressions
+    """
+    if old is None:
+        return '', 0
+
+    text = ''
+    regressions = 0
+    for key, value in result.items():
+        if key not in old:
+            continue
+        ratio = value / max(old[key], 1e-9)
+        text += "  ({:+.0f}%)".format(100*(ratio-1))
+        if ratio > threshold and value - old[key] > floors[key]:
+            text += " REGRESSION"
+            regressions += 1
+
+    return text, regressions
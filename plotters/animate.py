@@ -0,0 +1,256 @@
+"""
+Functions used for the animated time-lapse of the pseudo US map
+
+Each frame shows the last -window days up to the frame's date in every
+state of the map.  The figure (axes, labels, titles) is drawn once; the
+frames only restore that background and redraw the lines and the date
+(blitting).  The frames can be rendered by several processes (-jobs) and
+are written as a GIF (Pillow) or, for *.mp4 files, with ffmpeg.  Other
+file names given with -save are rejected.
+"""
+
+import shutil
+import subprocess
+import sys
+import zlib
+
+import support.jhu_data as jhu
+import support.parallel as parallel
+import support.profile as profile
+import support.util as su
+import support.figures as figures
+import numpy as np
+
+from plotters.map import plot_map
+
+
+def plot(args, jhu_data=None):
+
+    plot_deaths    = 'deaths'    in args.data_type
+    plot_confirmed = 'confirmed' in args.data_type
+
+    if args.saveas and not args.saveas.endswith(('.gif','.mp4')):
+        print("\nAnimations can only be saved as .gif or .mp4 files: " + args.saveas + "\n")
+        sys.exit(1)
+
+    if jhu_data is None:
+        jhu_data = jhu.JHUData(args.max_age, args.source, args.memo)
+
+    states = [x for x in plot_map.reshape(-1) if x != '']
+
+    frequency = 'daily' if args.daily else 'raw'
+    data = dict()
+    for state in states:
+        data[state] = jhu_data.get_state_data(
+            state,
+            data_type=args.data_type,
+            frequency=frequency,
+            smooth=args.smooth,
+            yscale=args.yscale,
+            kernel=args.kernel,
+        )
+
+    dates = jhu_data.get_dates(
+        data_type=args.data_type,
+        frequency=frequency,
+        smooth=args.smooth,
+        kernel=args.kernel)
+    dates = dates[args.data_type[0]]
+
+    # every series ends on the last date, so align them all at the end
+    ndays = min( [ len(v) for sd in data.values() for v in sd.values() ] )
+    for sd in data.values():
+        for dt in sd:
+            sd[dt] = sd[dt][-ndays:]
+    dates = dates[-ndays:]
+
+    window = min(args.window, ndays)
+    frames = list(range(window, ndays+1, args.step))
+    if frames[-1] != ndays:
+        frames.append(ndays)
+
+    max_Y = max( [ v.max() for sd in data.values() for v in sd.values() ] )
+
+    if args.yscale is not None:
+        y_ticks, yscale = su.y_ticks(max_Y)
+
+    scales = dict()
+    for state in states:
+        if args.yscale is None:
+            max_y = max( [ max(data[state][dt]) for dt in args.data_type ] )
+            y_ticks, yscale = su.y_ticks(max_y)
+        else:
+            max_y = max_Y
+        scales[state] = (yscale, 1.1*max_y*yscale)
+
+    title = '{} Covid-19 {} by State'.format(
+        'New' if args.daily else 'Total',
+        'Confirmed Cases and Deaths' if plot_deaths and plot_confirmed else
+        'Deaths' if plot_deaths else 'Confirmed Cases'
+    )
+    if args.yscale == 'per_capita':
+        title += ' (per capita)'
+    title += f' ({window} day window)'
+
+    if args.yscale == 'common':
+        y_span = "Plots show between 0 and {:,} {}{}".format(
+            int( y_ticks[-1] ),
+            'cases' if plot_confirmed else 'deaths',
+            ' per day' if args.daily else '')
+    elif args.yscale == 'per_capita':
+        y_span = "Plots show between 0 and {} {}{} per {:,} people".format(
+            int(yscale * max_Y),
+            'cases' if plot_confirmed else 'deaths',
+            ' per day' if args.daily else '',
+            int(yscale))
+    else:
+        y_span = "Each state is scaled individually to fill the plot"
+
+    context = dict(
+        args=args, data=data, dates=dates, window=window,
+        scales=scales, title=title, y_span=y_span)
+
+    if args.show:
+        show(frames, **context)
+        return
+
+    filename = args.filename()
+    if not args.saveas:
+        filename = filename[:-len('.png')] + '.gif'
+
+    # one contiguous run of frames per process, so that each process only
+    # draws its static background once
+    nchunk = max(1, min(args.jobs, len(frames)))
+    chunks = [ x.tolist() for x in np.array_split(frames, nchunk) ]
+
+    rendered = parallel.run(_render_frames, chunks, args.jobs, animate=context)
+    size = rendered[0][0]
+    encoded = [ frame for _,chunk in rendered for frame in chunk ]
+
+    with profile.stage('save'):
+        if filename.endswith('.mp4'):
+            write_mp4(filename, size, encoded, args.fps)
+        else:
+            write_gif(filename, size, encoded, args.fps)
+
+    print("Animation ({} frames) saved to: {}".format(len(encoded), filename))
+
+
+def draw_map(args, data, dates, window, scales, title, y_span, pyplot=False):
+    """
+    Creates the map figure showing the first window of days and returns
+    it along with a function that updates it to the window ending at a
+    given day (which returns the artists it changed)
+    """
+    fig = figures.GridFigure(plot_map, [0.05,0.85], 7.5, pyplot=pyplot)
+    fig.fig.set_dpi(args.dpi)
+
+    x = np.arange(window)
+    for state, sd in data.items():
+        yscale, max_y = scales[state]
+        fig.panel(state,
+            [ x for dt in args.data_type ],
+            [ sd[dt][:window]*yscale for dt in args.data_type ],
+            max_y,
+            state)
+
+    fig.suptitle(title)
+    fig.footer(frame_span(dates, window), y_span)
+
+    artists = [ line for lines in fig.lines.values() for line in lines ]
+    artists.append(fig.notes[0])
+
+    def update(end):
+        for state, sd in data.items():
+            yscale = scales[state][0]
+            for line, dt in zip(fig.lines[state], args.data_type):
+                line.set_ydata(sd[dt][end-window:end]*yscale)
+        fig.notes[0].set_text(frame_span(dates, end))
+        return artists
+
+    return fig, update, artists
+
+
+def frame_span(dates, end):
+    """Date of the last day shown in a frame ending at day end"""
+    return "Data through {}".format(su.timespan(dates[end-1:end])[-1])
+
+
+def _render_frames(frames):
+    """
+    Renders frames (a list of end days) using the context in the parallel
+    shared dict and returns the frame size and the compressed RGB frames
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with profile.stage('layout'):
+        fig, update, artists = draw_map(**parallel.shared['animate'])
+
+        canvas = FigureCanvasAgg(fig.fig)
+        for artist in artists:
+            artist.set_animated(True)
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.fig.bbox)
+
+    rval = []
+    with profile.stage('draw'):
+        for end in frames:
+            canvas.restore_region(background)
+            for artist in update(end):
+                fig.fig.draw_artist(artist)
+            rgb = np.asarray(canvas.buffer_rgba())[:,:,:3]
+            rval.append(zlib.compress(rgb.tobytes(), 1))
+
+    return (rgb.shape[1], rgb.shape[0]), rval
+
+
+def write_gif(filename, size, frames, fps):
+    """Writes the compressed RGB frames as an animated GIF"""
+    from PIL import Image
+
+    def images():
+        for frame in frames:
+            yield Image.frombytes('RGB', size, zlib.decompress(frame))
+
+    images = images()
+    first = next(images).quantize(colors=256)
+    rest = ( im.quantize(palette=first, dither=0) for im in images )
+
+    first.save(filename, save_all=True, append_images=rest,
+               duration=round(1000/fps), loop=0)
+
+
+def write_mp4(filename, size, frames, fps):
+    """Writes the compressed RGB frames as an H.264 video (needs ffmpeg)"""
+    if shutil.which('ffmpeg') is None:
+        print("\nffmpeg is needed to write " + filename + "\n")
+        sys.exit(1)
+
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+        '-s', '{}x{}'.format(*size), '-r', str(fps), '-i', '-',
+        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+        '-vcodec', 'libx264', '-pix_fmt', 'yuv420p',
+        filename ]
+
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE) as proc:
+        for frame in frames:
+            proc.stdin.write(zlib.decompress(frame))
+        proc.stdin.close()
+
+    if proc.returncode != 0:
+        print("\nffmpeg failed to write " + filename + "\n")
+        sys.exit(1)
+
+
+def show(frames, **context):
+    """Plays the animation on screen"""
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig, update, artists = draw_map(**context, pyplot=True)
+
+    anim = FuncAnimation(fig.fig, update, frames=frames, blit=True,
+                         interval=1000/context['args'].fps)
+    plt.show()
@@ -7,19 +7,23 @@ import sys
 import support.jhu_data as jhu
 import support.util as su
 import support.states as sst
+import support.figures as figures
+import support.profile as profile
+import support.renders as renders
 import math
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
 
-def plot(args):
+def plot(args, jhu_data=None):
 
     plot_deaths    = 'deaths'    in args.data_type
     plot_confirmed = 'confirmed' in args.data_type
 
     state = args.state
 
-    jhu_data = jhu.JHUData(args.max_age)
+    if jhu_data is None:
+        jhu_data = jhu.JHUData(args.max_age, args.source, args.memo)
 
     frequency = 'daily' if args.daily else 'raw'
     data = jhu_data.get_county_data(
@@ -28,12 +32,14 @@ def plot(args):
         frequency=frequency,
         smooth=args.smooth,
         yscale=args.yscale,
+        kernel=args.kernel,
     )
 
     dates = jhu_data.get_dates(
         data_type=args.data_type,
         frequency=frequency,
-        smooth=args.smooth)
+        smooth=args.smooth,
+        kernel=args.kernel)
 
     timespan = su.timespan(dates)
     timespan = "Plots cover period from {} to {}".format(timespan[0],timespan[-1])
@@ -59,50 +65,8 @@ def plot(args):
     nrow = math.ceil(math.sqrt(n * 0.75))
     ncol = math.ceil(n/nrow)
 
-    fig, axs = plt.subplots(nrow, ncol)
-
-    irow = 0
-    icol = 0
-    for county, cd in data.items():
-
-        if args.yscale is None:
-            max_y = max( [ max(cd[dt]) for dt in args.data_type ] )
-            y_ticks, yscale = su.y_ticks(max_y)
-        else:
-            max_y = max_Y
-
-        for dt in args.data_type:
-            x = x_values[dt]
-            y = cd[dt]*yscale
-            axs[irow,icol].plot(x,y)
-            axs[irow,icol].set_ylim(0,1.1*max_y*yscale)
-            axs[irow,icol].set_xticks([])
-            axs[irow,icol].set_yticks([])
-            axs[irow,icol].annotate(
-                county,[0.0,0.8], 
-                xycoords='axes fraction',
-                fontsize='x-small')
-
-        icol += 1
-        if icol == ncol:
-            icol = 0
-            irow += 1
-
-    while irow < nrow:
-        while icol < ncol:
-            axs[irow][icol].axis('off')
-            icol += 1
-        icol = 0
-        irow += 1
-
-    plt.suptitle(title)
-
-    axs[nrow-1,ncol-1].annotate(timespan,
-            xy=(1,0), xycoords='figure fraction',
-            xytext=(-5,5), textcoords='offset points',
-            ha='right', va='bottom',
-            fontsize='x-small',
-            )
+    layout = list(data) + ['']*(nrow*ncol - n)
+    layout = np.array(layout).reshape(nrow, ncol)
 
     if args.yscale == 'common':
         y_span = "Plots show between 0 and {:,} {}{}".format(
@@ -118,19 +82,38 @@ def plot(args):
     else:
         y_span = "Each county is scaled individually to fill the plot"
 
-    axs[nrow-1,ncol-1].annotate(y_span,
-        xy=(0,0), xycoords='figure fraction',
-        xytext=(5,5), textcoords='offset points',
-        ha='left', va='bottom',
-        fontsize='x-small',
-        )
+    render_key = renders.key(args, data, x_values, title, timespan, y_span)
+    if args.save and renders.reuse(render_key, args.filename()):
+        return
+
+    with profile.stage('layout'):
+        fig = figures.grid(layout, len(args.data_type), [0.0,0.8], 'x-small',
+                           pooled=not args.show, fast=args.fast)
+
+    with profile.stage('draw'):
+        for county, cd in data.items():
+
+            if args.yscale is None:
+                max_y = max( [ max(cd[dt]) for dt in args.data_type ] )
+                y_ticks, yscale = su.y_ticks(max_y)
+            else:
+                max_y = max_Y
+
+            fig.panel(county,
+                [ x_values[dt] for dt in args.data_type ],
+                [ cd[dt]*yscale for dt in args.data_type ],
+                1.1*max_y*yscale,
+                county)
 
-    plt.gcf().set_size_inches(12,8)
+        fig.suptitle(title)
+        fig.footer(timespan, y_span)
 
     if args.save:
         filename = args.filename()
-        plt.savefig(filename,dpi=100)
-        print("Plot saved to: " + filename)
+        with profile.stage('save'):
+            fig.savefig(filename,dpi=100)
+        renders.store(render_key, filename)
+        print("Plot saved to: {}".format(filename))
 
     if args.show:
         plt.show()
@@ -0,0 +1,127 @@
+"""
+Functions used for the national heatmap of every county
+
+The plot has one row per county (about 3,000 of them) and one column per
+day, coloured by the count (or the count per 100,000 people with
+-percapita).  The rows come from the county matrix of the whole country,
+which is derived (and smoothed) in one pass, and are drawn by a single
+imshow.  The counties are grouped by state, or ordered by their peak or
+current (latest) value with -sort.
+"""
+
+import sys
+
+import support.jhu_data as jhu
+import support.profile as profile
+import support.renders as renders
+import support.util as su
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import numpy as np
+
+# colours are scaled to this percentile so that a few outliers do not wash out the rest
+percentile = 99.5
+
+
+def plot(args, jhu_data=None):
+
+    if len(args.data_type) > 1:
+        print("\nCannot plot both deaths and cases in a heatmap\n");
+        sys.exit(1)
+
+    data_type = args.data_type[0]
+
+    if jhu_data is None:
+        jhu_data = jhu.JHUData(args.max_age, args.source, args.memo)
+
+    frequency = 'daily' if args.daily else 'raw'
+    states, counties, matrix = jhu_data.get_county_matrix(
+        data_type=data_type,
+        frequency=frequency,
+        smooth=args.smooth,
+        yscale=args.yscale,
+        kernel=args.kernel,
+    )
+
+    dates = jhu_data.get_dates(
+        data_type=data_type,
+        frequency=frequency,
+        smooth=args.smooth,
+        kernel=args.kernel)
+
+    if args.yscale == 'per_capita':
+        matrix = 100000 * matrix
+
+    if args.sort_by == 'peak':
+        order = np.argsort(-matrix.max(axis=1), kind='stable')
+    elif args.sort_by == 'current':
+        order = np.argsort(-matrix[:,-1], kind='stable')
+    else:
+        order = np.arange(len(states))
+
+    states   = states[order]
+    counties = counties[order]
+    matrix   = matrix[order]
+
+    timespan = su.timespan(dates)
+    timespan = "Plot covers period from {} to {}".format(timespan[0],timespan[-1])
+
+    title = '{} Covid-19 {} by County{}'.format(
+        'New' if args.daily else 'Total',
+        'Deaths' if data_type == 'deaths' else 'Confirmed Cases',
+        ' (per capita)' if args.yscale == 'per_capita' else '')
+
+    label = '{}{}{}'.format(
+        'Deaths' if data_type == 'deaths' else 'Cases',
+        ' per day' if args.daily else '',
+        ' per 100,000 people' if args.yscale == 'per_capita' else '')
+
+    render_key = renders.key(args, states, counties, matrix, dates, title)
+    if args.save and renders.reuse(render_key, args.filename()):
+        return
+
+    if args.show:
+        plt.ion()
+
+    with profile.stage('layout'):
+        fig = plt.figure(figsize=(12,8))
+        ax  = fig.add_subplot(1,1,1)
+
+    with profile.stage('draw'):
+        x = mdates.date2num(su.x_values(dates))
+        vmax = max(np.percentile(matrix, percentile), 1e-9)
+
+        image = ax.imshow(matrix,
+            aspect='auto', interpolation='antialiased', cmap='inferno',
+            vmin=0, vmax=vmax,
+            extent=[x[0]-0.5, x[-1]+0.5, len(matrix), 0])
+        fig.colorbar(image, ax=ax, fraction=0.03, pad=0.01, label=label)
+
+        ax.xaxis_date()
+        ax.xaxis.set_major_locator(mdates.MonthLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%b'))
+
+        if args.sort_by == 'state':
+            starts = np.flatnonzero(np.r_[True, states[1:] != states[:-1]])
+            ends   = np.r_[starts[1:], len(states)]
+            # the labels of states with only a few counties would overlap
+            big    = ends - starts >= len(states)/100
+            ax.set_yticks((starts + ends)[big]/2, states[starts[big]], fontsize='xx-small')
+            ax.tick_params(axis='y', length=0)
+            ax.hlines(starts[1:], x[0]-0.5, x[-1]+0.5, colors='white', linewidth=0.3)
+            ax.set_ylabel("Counties by state")
+        else:
+            ax.set_ylabel("Counties by {} value".format(args.sort_by))
+
+        ax.set_title(title)
+        fig.text(0.99, 0.01, timespan, ha='right', va='bottom', fontsize='x-small')
+
+    if args.save:
+        filename = args.filename()
+        with profile.stage('save'):
+            fig.savefig(filename,dpi=100)
+        renders.store(render_key, filename)
+        print("Plot saved to: {}".format(filename))
+
+    if args.show:
+        input("Press Enter to continue...")
@@ -7,26 +7,31 @@ import sys
 import support.jhu_data as jhu
 import support.util as su
 import support.states as sst
+import support.figures as figures
+import support.profile as profile
+import support.renders as renders
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
 
-def plot(args):
+plot_map = np.array( [
+    ['AK',''  ,''  ,''  ,''  ,'WI',''  ,''  ,'VT','NH','ME'],
+    ['WA','ID','MT','ND','MN','IL','MI',''  ,'NY','MA',''  ],
+    ['OR','NV','WY','SD','IA','IN','OH','PA','NJ','CT','RI'],
+    ['CA','UT','CO','NE','MO','KY','WV','VA','MD','DE',''  ],
+    [''  ,'AZ','NM','KS','AR','TN','NC','SC','DC',''  ,''  ],
+    [''  ,''  ,''  ,'OK','LA','MS','AL','GA',''  ,''  ,''  ],
+    ['HI',''  ,''  ,'TX',''  ,''  ,''  ,''  ,'FL',''  ,'PR']
+    ])
+
+
+def plot(args, jhu_data=None):
 
     plot_deaths    = 'deaths'    in args.data_type
     plot_confirmed = 'confirmed' in args.data_type
 
-    jhu_data = jhu.JHUData(args.max_age)
-
-    plot_map = np.array( [
-        ['AK',''  ,''  ,''  ,''  ,'WI',''  ,''  ,'VT','NH','ME'],
-        ['WA','ID','MT','ND','MN','IL','MI',''  ,'NY','MA',''  ],
-        ['OR','NV','WY','SD','IA','IN','OH','PA','NJ','CT','RI'],
-        ['CA','UT','CO','NE','MO','KY','WV','VA','MD','DE',''  ],
-        [''  ,'AZ','NM','KS','AR','TN','NC','SC','DC',''  ,''  ],
-        [''  ,''  ,''  ,'OK','LA','MS','AL','GA',''  ,''  ,''  ],
-        ['HI',''  ,''  ,'TX',''  ,''  ,''  ,''  ,'FL',''  ,'PR']
-        ])
+    if jhu_data is None:
+        jhu_data = jhu.JHUData(args.max_age, args.source, args.memo)
 
     states = [x for x in plot_map.reshape(-1) if x != '']
 
@@ -40,12 +45,14 @@ def plot(args):
             frequency=frequency,
             smooth=args.smooth,
             yscale=args.yscale,
+            kernel=args.kernel,
         )
 
     dates = jhu_data.get_dates(
         data_type=args.data_type,
         frequency=frequency,
-        smooth=args.smooth)
+        smooth=args.smooth,
+        kernel=args.kernel)
 
     timespan = su.timespan(dates)
     timespan = "Plots cover period from {} to {}".format(timespan[0],timespan[-1])
@@ -67,49 +74,6 @@ def plot(args):
         title += ' (per capita)'
 
 
-    nrow, ncol = plot_map.shape
-    fig, axs = plt.subplots(nrow, ncol)
-
-    if args.show:
-        plt.ion()
-
-    for row in range(nrow):
-        for col in range(ncol):
-            state = plot_map[row,col]
-            if state not in states:
-                axs[row,col].axis('off')
-                continue
-
-            state_total = jhu_data.get_state_current_total(state)
-            state_pop   = sst.abbrev_population[state]
-            current_pct = 100.*state_total/state_pop
-
-            if args.yscale is None:
-                max_y = max( [ max(data[state][dt]) for dt in args.data_type ] )
-                y_ticks, yscale = su.y_ticks(max_y)
-            else:
-                max_y = max_Y
-
-            for dt in args.data_type:
-                x = x_values[dt]
-                y = data[state][dt]*yscale
-                axs[row,col].plot(x,y)
-                axs[row,col].set_ylim(0,1.1*max_y*yscale)
-                axs[row,col].set_xticks([])
-                axs[row,col].set_yticks([])
-                label = f'{state} ({current_pct:.1f}%)'
-                axs[row,col].annotate(label,[0.05,0.85], xycoords='axes fraction',
-                                     fontsize=7.5)
-
-    plt.suptitle(title)
-
-    axs[nrow-1,ncol-1].annotate(timespan,
-            xy=(1,0), xycoords='figure fraction',
-            xytext=(-5,5), textcoords='offset points',
-            ha='right', va='bottom',
-            fontsize='x-small',
-            )
-
     if args.yscale == 'common':
         y_span = "Plots show between 0 and {:,} {}{}".format(
             int( y_ticks[-1] ),
@@ -124,19 +88,47 @@ def plot(args):
     else:
         y_span = "Each state is scaled individually to fill the plot"
 
-    axs[nrow-1,ncol-1].annotate(y_span,
-        xy=(0,0), xycoords='figure fraction',
-        xytext=(5,5), textcoords='offset points',
-        ha='left', va='bottom',
-        fontsize='x-small',
-        )
+    labels = dict()
+    for state in states:
+        state_total = jhu_data.get_state_current_total(state)
+        state_pop   = sst.abbrev_population[state]
+        current_pct = 100.*state_total/state_pop
+        labels[state] = f'{state} ({current_pct:.1f}%)'
+
+    render_key = renders.key(args, data, x_values, labels, title, timespan, y_span)
+    if args.save and renders.reuse(render_key, args.filename()):
+        return
+
+    with profile.stage('layout'):
+        fig = figures.grid(plot_map, len(args.data_type), [0.05,0.85], 7.5,
+                           pooled=not args.show, fast=args.fast)
+
+    if args.show:
+        plt.ion()
+
+    with profile.stage('draw'):
+        for state in states:
+            if args.yscale is None:
+                max_y = max( [ max(data[state][dt]) for dt in args.data_type ] )
+                y_ticks, yscale = su.y_ticks(max_y)
+            else:
+                max_y = max_Y
+
+            fig.panel(state,
+                [ x_values[dt] for dt in args.data_type ],
+                [ data[state][dt]*yscale for dt in args.data_type ],
+                1.1*max_y*yscale,
+                labels[state])
 
-    plt.gcf().set_size_inches(12,8)
+        fig.suptitle(title)
+        fig.footer(timespan, y_span)
 
     if args.save:
         filename = args.filename()
-        plt.savefig(filename,dpi=100)
-        print("Plot saved to: " + filename)
+        with profile.stage('save'):
+            fig.savefig(filename,dpi=100)
+        renders.store(render_key, filename)
+        print("Plot saved to: {}".format(filename))
 
     if args.show:
         plt.show()
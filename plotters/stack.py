@@ -7,9 +7,12 @@ import support.jhu_data as jhu
 import matplotlib.pyplot as plt
 import numpy as np
 
+import support.profile as profile
+import support.renders as renders
+import support.util as su
 import support.states as sst
 
-def plot(args):
+def plot(args, jhu_data=None):
 
     if len(args.data_type) > 1:
         print("\nCannot plot both deaths and cases in a stack plot\n");
@@ -17,8 +20,9 @@ def plot(args):
 
     data_type = args.data_type[0]
 
-    data = jhu.JHUData( args.max_age )
-    data = data[data_type]
+    if jhu_data is None:
+        jhu_data = jhu.JHUData( args.max_age, args.source, args.memo )
+    data = jhu_data[data_type]
         
     if args.sort_by == 'current':
         sd = data.weekly.state
@@ -42,37 +46,46 @@ def plot(args):
         "Cases" if data_type == 'confirmed' else 'Deaths'
     )
 
-    weeks = data.weeks
+    # the weeks are plotted as categories, labelled as in the JHU files
+    weeks = su.date_labels(data.weeks)
 
     cases = [ data.weekly.state[state] for state in states ]
 
     if not args.daily:
         cases = [ np.cumsum(x) for x in cases ]
 
+    render_key = renders.key(args, states, weeks, cases, title, ylabel)
+    if args.save and renders.reuse(render_key, args.filename()):
+        return
+
     if args.show:
         plt.ion()
 
-    fig = plt.figure(figsize=(12,8))
-    fig.add_subplot(1,1,1)
+    with profile.stage('layout'):
+        fig = plt.figure(figsize=(12,8))
+        fig.add_subplot(1,1,1)
 
-    plt.stackplot(weeks,cases)
-    plt.legend(states,loc='upper left',ncol=2,fontsize='xx-small')
-    plt.xticks(rotation=-90)
-    plt.xlabel("Week")
-    plt.ylabel(ylabel)
-    plt.title(title)
+    with profile.stage('draw'):
+        plt.stackplot(weeks,cases)
+        plt.legend(states,loc='upper left',ncol=2,fontsize='xx-small')
+        plt.xticks(rotation=-90)
+        plt.xlabel("Week")
+        plt.ylabel(ylabel)
+        plt.title(title)
 
-    if not args.daily:
-        yl = [ 100*x/sst.us_population for x in plt.gca().get_ylim() ]
-        ax2 = plt.twinx()
-        plt.ylim(yl)
-        ax2.yaxis.set_major_formatter(lambda x,_: f'{x:.1f}%')
+        if not args.daily:
+            yl = [ 100*x/sst.us_population for x in plt.gca().get_ylim() ]
+            ax2 = plt.twinx()
+            plt.ylim(yl)
+            ax2.yaxis.set_major_formatter(lambda x,_: f'{x:.1f}%')
 
     if args.save:
         plt.gcf().set_size_inches(12,8)
         filename = args.filename()
-        plt.savefig(filename,dpi=100)
-        print("Plot saved to: " + filename)
+        with profile.stage('save'):
+            plt.savefig(filename,dpi=100)
+        renders.store(render_key, filename)
+        print("Plot saved to: {}".format(filename))
 
     if args.show:
         input("Press Enter to continue...")
@@ -5,15 +5,19 @@ Functions used for plotting the Covid state plots
 import sys
 
 import support.jhu_data as jhu
+import support.parallel as parallel
+import support.profile as profile
+import support.renders as renders
 import support.util as su
 import support.states as sst
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
 
-def plot(args):
+def plot(args, jhu_data=None):
     
-    jhu_data = jhu.JHUData(args.max_age)
+    if jhu_data is None:
+        jhu_data = jhu.JHUData(args.max_age, args.source, args.memo)
 
     states = args.states
 
@@ -39,12 +43,14 @@ def plot(args):
             frequency=frequency,
             smooth=args.smooth,
             yscale=args.yscale,
+            kernel=args.kernel,
         )
 
     dates = jhu_data.get_dates(
         data_type=args.data_type,
         frequency=frequency,
-        smooth=args.smooth)
+        smooth=args.smooth,
+        kernel=args.kernel)
 
     x_values = su.x_values(dates)
 
@@ -66,19 +72,55 @@ def plot(args):
     else:
         ylabel = None
 
+    context = dict(
+        args=args, data=data, x_values=x_values, max_Y=max_Y,
+        title=title, ylabel=ylabel)
+
+    if args.save and not args.show and args.jobs > 1:
+        for filename in parallel.run(_save_state, states, args.jobs, states=context):
+            if filename is not None:
+                print("Plot saved to: " + filename)
+        return
+
     for state in states:
         if args.show:
             plt.ion()
 
-        if args.yscale is None:
-            max_y = max( [ max(data[state][dt]) for dt in args.data_type ] )
-            y_ticks, yscale = su.y_ticks(max_y)
-        else:
-            max_y = max_Y
+        filename = draw_state(state, **context)
+
+        if filename is not None:
+            print("Plot saved to: {}".format(filename))
+
+        if args.show:
+            if args.delay > 0:
+                plt.pause(args.delay)
+            else:
+                input("Press Enter to continue...")
+
+
+def draw_state(state, args, data, x_values, max_Y, title, ylabel):
+    """
+    Draws the plot for a single state into the current figure
 
+    Returns the name of the file the plot was saved to (or None if it was
+    not saved or an unchanged plot was reused)
+    """
+    if args.yscale is None:
+        max_y = max( [ max(data[state][dt]) for dt in args.data_type ] )
+    else:
+        max_y = max_Y
+
+    render_key = renders.key(args, state, data[state], x_values, max_y, title, ylabel)
+    if args.save and renders.reuse(render_key, args.filename(state=state)):
+        return None
+
+    y_ticks, yscale = su.y_ticks(max_y)
+
+    with profile.stage('layout'):
         plt.gca().set_prop_cycle(None)
         plt.cla()
 
+    with profile.stage('draw'):
         for dt in args.data_type:
             plt.plot(x_values[dt],data[state][dt]*yscale)
 
@@ -95,18 +137,17 @@ def plot(args):
             plt.ylabel(ylabel)
         plt.grid()
 
-        if args.save:
-            plt.gcf().set_size_inches(12,8)
-            filename = args.filename(state=state)
-            plt.savefig(filename,dpi=100)
-            print("Plot saved to: " + filename)
-
-        if args.show:
-            if args.delay > 0:
-                plt.pause(args.delay)
-            else:
-                input("Press Enter to continue...")
+    if not args.save:
+        return None
 
+    plt.gcf().set_size_inches(12,8)
+    filename = args.filename(state=state)
+    with profile.stage('save'):
+        plt.savefig(filename,dpi=100)
+    renders.store(render_key, filename)
+    return filename
 
 
-        
+def _save_state(state):
+    """Worker entry point: draws one state using the fork-inherited context"""
+    return draw_state(state, **parallel.shared['states'])
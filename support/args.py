@@ -21,7 +21,10 @@ class Args:
             
 
         if self.data_type == None:
-            self.data_type = ['confirmed']
+            if self.action == 'export':
+                self.data_type = ['deaths','confirmed']
+            else:
+                self.data_type = ['confirmed']
 
         self.save = True if (self.saveas or self.saveas is None) else False
 
@@ -48,6 +51,10 @@ class Args:
 
     def filename(self, data_type=None, state=None):
 
+        # a file object to save into (e.g. the in-memory buffer of the render server)
+        if self.saveas and not isinstance(self.saveas,str):
+            return self.saveas
+
         if data_type is None:
             data_type = 'combined' if len(self.data_type) > 1 else self.data_type[0]
 
@@ -93,6 +100,14 @@ def parse_args(args):
         epilog = "."
     )
 
+    parser.add_argument(
+        '-importtime', action='store_true',
+        help = 'Report the time spent importing modules during the run')
+    parser.add_argument(
+        '-profile', nargs='?', const='', metavar='file',
+        help = 'Report the time and memory of each stage of the run, '
+               'optionally writing a Chrome trace (.json) or cProfile dump (other names)')
+
     common = common_args()
     yscale = yscale_args()
     sort   = sort_args()
@@ -123,6 +138,9 @@ def parse_args(args):
     state_parser.add_argument(
         '-delay', default=1, metavar='sec', type=int,
         help='How long to pause between states (0=wait for enter key)')
+    state_parser.add_argument(
+        '-jobs', default=1, metavar='N', type=int,
+        help='Number of processes used to render the states (requires -save)')
 
     county_parser = subparsers.add_parser(
         'counties',
@@ -137,6 +155,120 @@ def parse_args(args):
 
     county_parser.add_argument('state')
 
+    for grid_parser in [county_parser, map_parser]:
+        grid_parser.add_argument(
+            '-fast', action = 'store_true',
+            help = "Draw all the small plots as a single collection of lines "
+                   "(much faster for many plots, out of range values are clipped)")
+
+    heatmap_parser = subparsers.add_parser(
+        'heatmap',
+        parents = [common, yscale],
+        help = 'Plot every county in the country as one row of a heatmap')
+
+    heatmap_parser.add_argument(
+        '-sort', dest='sort_by', default='state',
+        choices=['state','peak','current'],
+        help = "Order of the counties: state (default), peak or current")
+
+    animate_parser = subparsers.add_parser(
+        'animate',
+        parents = [common, yscale],
+        epilog = "The animation is saved as a GIF, or as an MP4 if the file name ends in .mp4 (other names are rejected)",
+        help = 'Animate the pseudo US map through time')
+
+    animate_parser.add_argument(
+        '-window', default=90, metavar='days', type=int,
+        help = 'Number of days shown in each frame (default=90)')
+    animate_parser.add_argument(
+        '-step', default=1, metavar='days', type=int,
+        help = 'Number of days between frames (default=1)')
+    animate_parser.add_argument(
+        '-fps', default=10, metavar='N', type=int,
+        help = 'Frames per second (default=10)')
+    animate_parser.add_argument(
+        '-dpi', default=60, metavar='N', type=int,
+        help = 'Resolution of the 12x8 inch frames (default=60)')
+    animate_parser.add_argument(
+        '-jobs', default=1, metavar='N', type=int,
+        help='Number of processes used to render the frames')
+
+    export_parser = subparsers.add_parser(
+        'export',
+        epilog = "Exports both data types unless -deaths or -confirmed is given",
+        help = 'Export the processed data for use by other tools')
+
+    export_parser.add_argument(
+        'directory', nargs='?', default='exports',
+        help = "Directory to write the export to (default=exports)")
+    export_parser.add_argument(
+        '-format', default='npy', choices=['npy','npz','parquet','feather'],
+        help = "npy (default, memory-mappable), npz, parquet or feather (need pyarrow)")
+    export_parser.add_argument(
+        '-append', action = 'store_true',
+        help = "Only add the days missing from a previous export (not for npz)")
+    export_parser.add_argument(
+        '-deaths', dest='data_type',
+        action = 'append_const', const='deaths',
+        help = 'Export the number of deaths')
+    export_parser.add_argument(
+        '-confirmed', dest='data_type',
+        action = 'append_const', const='confirmed',
+        help = 'Export the number of confirmed cases')
+    export_parser.add_argument(
+        '-reload', dest='max_age',
+        action = 'store_const', const=0, default=86400,
+        help = "Reload data from JHU (ignore any cached data)")
+    export_parser.add_argument(
+        '-source', metavar='url|dir',
+        help = "Where to get the JHU files (URL, mirror directory or file pattern)")
+
+    batch_parser  = subparsers.add_parser(
+        'batch',
+        epilog = "Each line of the job file holds the arguments for one plot",
+        help = 'Render every plot listed in a job file in one process')
+
+    batch_parser.add_argument(
+        'jobfile', metavar='file',
+        help = "Job file (one covidplot command per line, # for comments)")
+    batch_parser.add_argument(
+        '-jobs', default=1, metavar='N', type=int,
+        help='Number of processes used to render the jobs')
+    batch_parser.add_argument(
+        '-reload', dest='max_age',
+        action = 'store_const', const=0, default=86400,
+        help = "Reload data from JHU (ignore any cached data)")
+    batch_parser.add_argument(
+        '-source', metavar='url|dir',
+        help = "Where to get the JHU files (URL, mirror directory or file pattern)")
+    batch_parser.add_argument(
+        '-memo', action = 'store_true',
+        help = "Keep derived (smoothed/scaled) series on disk for later runs")
+
+    serve_parser  = subparsers.add_parser(
+        'serve',
+        epilog = "Plots are requested as e.g. /map?deaths&percapita or /counties/NY?total&smooth=7",
+        help = 'Serve plots over HTTP from a long running process')
+
+    serve_parser.add_argument(
+        '-host', default='127.0.0.1',
+        help = "Address to listen on (default=127.0.0.1)")
+    serve_parser.add_argument(
+        '-port', default=8000, type=int,
+        help = "Port to listen on (default=8000)")
+    serve_parser.add_argument(
+        '-jobs', default=None, metavar='N', type=int,
+        help='Number of processes used to render the plots (default=number of CPUs)')
+    serve_parser.add_argument(
+        '-maxage', dest='max_age', default=86400, metavar='sec', type=int,
+        help = "Fetch the JHU data again once it is this old (default=86400)")
+    serve_parser.add_argument(
+        '-source', metavar='url|dir',
+        help = "Where to get the JHU files (URL, mirror directory or file pattern)")
+    serve_parser.add_argument(
+        '-memo', action = 'store_true',
+        help = "Keep derived (smoothed/scaled) series on disk for later runs")
+
     if len(args) > 0:
         return parser.parse_args(args)
     else:
@@ -174,6 +306,15 @@ def common_args():
         '-reload', dest='max_age',
         action = 'store_const', const=0, default=86400,
         help = "Reload data from JHU (ignore any cached data)")
+    parser.add_argument(
+        '-source', metavar='url|dir',
+        help = "Where to get the JHU files (URL, mirror directory or file pattern)")
+    parser.add_argument(
+        '-memo', action = 'store_true',
+        help = "Keep derived (smoothed/scaled) series on disk for later runs")
+    parser.add_argument(
+        '-rerender', action = 'store_true',
+        help = "Draw the plot even if an unchanged one is in the render cache")
 
     parser.set_defaults(daily=True)
 
@@ -186,6 +327,10 @@ def yscale_args():
     parser.add_argument(
         '-smooth', type=int, metavar='days', default=3,
         help = 'Number of days averaged to smooth the curve (default=3)' )
+    parser.add_argument(
+        '-kernel', default='trailing',
+        choices=['trailing','centered','exponential'],
+        help = 'Smoothing window: trailing (default), centered or exponential' )
 
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
@@ -0,0 +1,127 @@
+"""
+Functions for rendering a list of plots in a single process
+
+This file can be imported and contains the following functions:
+
+    * read_jobs - reads the job file into lists of command line arguments
+    * run       - renders every job in the job file
+"""
+
+import shlex
+import time
+
+import support.args
+import support.jhu_data as jhu
+import support.parallel as parallel
+import support.renders as renders
+
+from importlib import import_module
+from support.derived import DerivedCache
+
+
+def read_jobs(jobfile):
+    """
+    Reads a job file and returns one argument list per job
+
+    Blank lines and comments (#) are ignored.  A leading 'covidplot'
+    on a line is dropped so that the doit script can be used as is.
+    """
+    jobs = []
+    with open(jobfile) as fp:
+        for line in fp:
+            job = shlex.split(line, comments=True)
+            if job and job[0].endswith('covidplot'):
+                job = job[1:]
+            if job:
+                jobs.append(job)
+    return jobs
+
+
+def run(args):
+    """
+    Renders every job in args.jobfile, loading the JHU data only once
+
+    With args.jobs > 1, the jobs are spread across a pool of processes which
+    all share the JHU data loaded here.  Reports the time spent on each job
+    and the total time for the batch, and returns the number of jobs that
+    failed.
+    """
+    start = time.perf_counter()
+
+    jobs = read_jobs(args.jobfile)
+
+    # The data sets are loaded here, before any workers are forked, so that
+    # the workers never download (or cache) data of their own.  The map plot
+    # always needs the confirmed cases for its labels.
+    types = {'confirmed'}
+    for job in jobs:
+        try:
+            types.update(support.args.Args(job).data_type)
+        except SystemExit:
+            pass
+
+    jhu_data = jhu.JHUData(args.max_age, args.source, args.memo)
+    jhu_data.load(sorted(types))
+    load_time = time.perf_counter() - start
+    print("Loaded JHU data in {:.2f}s".format(load_time))
+
+    results = parallel.run(run_job, jobs, args.jobs, jhu_data=jhu_data)
+
+    failed = 0
+    for i,(job,(elapsed,ok,_)) in enumerate(zip(jobs,results)):
+        if not ok:
+            failed += 1
+        print("[{:{w}d}/{}] {:6.2f}s  {}{}".format(
+            i+1, len(jobs), elapsed, ' '.join(job), '' if ok else '  (failed)',
+            w=len(str(len(jobs)))))
+
+    print("Rendered {} of {} jobs in {:.2f}s (data load {:.2f}s)".format(
+        len(jobs) - failed, len(jobs), time.perf_counter() - start, load_time))
+
+    derived = DerivedCache()
+    reused = rendered = 0
+    for _,_,counts in results:
+        derived.hits   += counts[0]
+        derived.loads  += counts[1]
+        derived.misses += counts[2]
+        reused   += counts[3]
+        rendered += counts[4]
+    print("Derived series cache: " + derived.stats())
+    print("Render cache: {} reused, {} rendered".format(reused, rendered))
+
+    return failed
+
+
+def run_job(job):
+    """
+    Renders a single job using the JHU data in the parallel.shared dict
+
+    Returns the time spent on the job, whether it succeeded and the number
+    of hits, loads and misses of the derived series cache and of plots
+    reused and rendered (see support.renders) during the job
+    """
+    import matplotlib.pyplot as plt
+
+    derived = parallel.shared['jhu_data'].derived
+    counts  = (derived.hits, derived.loads, derived.misses, renders.reused, renders.rendered)
+
+    start = time.perf_counter()
+    try:
+        job_args = support.args.Args(job)
+        module = import_module(f'plotters.{job_args.action}')
+        module.plot(job_args, parallel.shared['jhu_data'])
+        ok = True
+    except SystemExit:
+        # the usage error has already been printed by argparse or the plotter
+        ok = False
+    except Exception as e:
+        # one bad job must not stop the rest of the batch
+        print("Job failed: {} ({}: {})".format(' '.join(job), type(e).__name__, e))
+        ok = False
+    finally:
+        plt.close('all')
+
+    counts = (derived.hits - counts[0], derived.loads - counts[1], derived.misses - counts[2],
+              renders.reused - counts[3], renders.rendered - counts[4])
+
+    return time.perf_counter() - start, ok, counts
@@ -1,28 +1,143 @@
 #!/usr/bin/env python
 
+import glob
+import numpy as np
+import os
 import support.states as states
+import support.util as su
 
 counties = {}
 
+# Population index keyed by FIPS code (see population_by_fips)
+index_file = 'data/fips_population.npz'
+missing_population = 1000000000000
+
+# Census county populations, compiled from the text file (see census)
+census_file = 'data/co-est2019-annres.dat'
+
+def census():
+    """
+    Returns a record array of the state code, county name and population
+    of each county in the census data
+
+    The text file is compiled into a binary .npy file the first time it is
+    read.  The name of the compiled file includes the modification time and
+    size of the text file, so it is regenerated whenever the text changes.
+    """
+    st = os.stat(census_file)
+    compiled = '{}.{}-{}.npy'.format(census_file[:-len('.dat')], st.st_mtime_ns, st.st_size)
+    try:
+        return np.load(compiled)
+    except OSError:
+        return compile_census(compiled)
+
+def compile_census(compiled):
+    """
+    Parses the census text file and writes it to compiled as a record array
+    (removing any previously compiled versions)
+    """
+    rows = np.loadtxt(census_file, delimiter='|', dtype=str, ndmin=2)
+
+    data = np.rec.fromarrays(
+        [ [ states.us_state_abbrev[x] for x in rows[:,1] ], rows[:,0], rows[:,2].astype(np.int64) ],
+        names = 'state,county,population')
+
+    for old in glob.glob(census_file[:-len('.dat')] + '.*-*.npy'):
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+    su.write_file(compiled, lambda fp: np.save(fp, data))
+
+    return data
+
 def load_data():
     if counties:
         return
-    with open('data/co-est2019-annres.dat') as fp:
-        for line in fp:
-            line = line.strip()
-            county,state,pop = line.split('|')
-            state = states.us_state_abbrev[state]
-            if state not in counties.keys():
-                counties[state] = {}
-            counties[state][county] = int(pop)
-
-def population(county,state):
+    data = census()
+    for state,county,pop in zip(*(data[k].tolist() for k in ['state','county','population'])):
+        if state not in counties.keys():
+            counties[state] = {}
+        counties[state][county] = pop
+
+def load_index():
+    """
+    Returns the FIPS population index as sorted arrays of FIPS codes and
+    populations (both empty if there is no index yet)
+    """
+    try:
+        with np.load(index_file) as npz:
+            return npz['fips'], npz['population']
+    except OSError:
+        return np.zeros(0,dtype=np.int32), np.zeros(0,dtype=np.int64)
+
+def update_index(fips,population):
+    """
+    Adds the given FIPS codes and populations to the FIPS population index
+
+    Used with the Population column of the JHU deaths time series, which
+    gives the population of every county by FIPS code.
+    """
+    fips       = np.asarray(fips)
+    population = np.asarray(population)
+
+    keep = (fips > 0) & (population > 0)
+
+    old_fips, old_population = load_index()
+    old = ~np.isin(old_fips, fips[keep])
+
+    fips       = np.concatenate([old_fips[old], fips[keep]])
+    population = np.concatenate([old_population[old], population[keep]])
+    order      = np.argsort(fips)
+
+    os.makedirs(os.path.dirname(index_file),exist_ok=True)
+    su.write_file(index_file, lambda fp: np.savez(fp, fips=fips[order], population=population[order]))
+
+def population_by_fips(fips,county,state):
+    """
+    Returns an array with the population of each of the given counties
+
+    The counties are looked up by FIPS code in the population index.  Any
+    that are not in the index (e.g. before the JHU deaths data has been
+    downloaded for the first time) are looked up by name in the census data.
+    Counties that cannot be found get missing_population.
+    """
+    rval, found = lookup_index(fips)
+
     load_data()
-    if state not in counties.keys():
-        print("Missing county data for {}".format(state))
-        return 1000000000000
-    if county not in counties[state].keys():
-        print("Missing county data for {}, {}".format(county,state))
-        return 1000000000000
-    return counties[state][county]
+    for k in np.flatnonzero(~found):
+        rval[k] = counties.get(state[k],{}).get(county[k],missing_population)
+
+    return rval
+
+def indexed_population(fips,population):
+    """
+    Returns a copy of population with the population of every county that
+    is in the FIPS population index taken from the index
+
+    Used to correct the populations of a data set that was parsed before
+    the index held all of its counties.
+    """
+    rval, found = lookup_index(fips)
+    rval[~found] = np.asarray(population)[~found]
+    return rval
+
+def lookup_index(fips):
+    """
+    Returns the indexed population of each of the given FIPS codes, and
+    whether it was found in the index (missing_population if it was not)
+    """
+    fips = np.asarray(fips)
+
+    index_fips, index_population = load_index()
+
+    rval  = np.full(fips.size, missing_population, dtype=np.int64)
+    found = np.zeros(fips.size, dtype=bool)
+
+    if index_fips.size > 0:
+        i = np.searchsorted(index_fips, fips).clip(0, index_fips.size-1)
+        found = index_fips[i] == fips
+        rval[found] = index_population[i[found]]
 
+    return rval, found
@@ -0,0 +1,165 @@
+"""
+Cache of derived (smoothed, scaled, ...) series
+
+This file can be imported and contains the following classes:
+
+    * DerivedCache - LRU cache of derived series with an optional disk layer
+    * size         - number of bytes held by a cached value
+
+The cached values are either a single array or a dict of arrays (one per
+county).  Keys are tuples which must start with the data type and the
+timestamp of the data set the value was derived from, so that entries on
+disk can be dropped when the data set is refreshed.
+"""
+
+import glob
+import hashlib
+import numpy as np
+import os
+import tempfile
+
+from collections import OrderedDict
+
+
+class DerivedCache:
+    """
+    LRU cache of derived series
+
+    The memory layer is bounded by the size of the arrays rather than the
+    number of entries, as an entry may be anything from the series of one
+    state to the whole county x day matrix of the country (tens of MB).
+
+    Attributes:
+        maxbytes - bytes of arrays kept in memory (the latest entry is kept
+                   even if it is larger)
+        nbytes   - bytes of arrays currently kept in memory
+        path     - directory for the on-disk layer (None to disable it)
+        hits     - lookups found in memory
+        loads    - lookups found on disk
+        misses   - lookups that had to be computed
+    """
+    def __init__(self,maxbytes=128<<20,path=None):
+        self.maxbytes = maxbytes
+        self.nbytes   = 0
+        self.path     = path
+        self.entries  = OrderedDict()
+        self.hits     = 0
+        self.loads    = 0
+        self.misses   = 0
+
+    def get(self,key,compute):
+        """
+        Returns the value cached for key, calling compute() to create it
+        if it is neither in memory nor on disk
+
+        The returned arrays are read-only as they are shared by all callers.
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        value = self.load(key)
+        if value is not None:
+            self.loads += 1
+        else:
+            self.misses += 1
+            value = compute()
+            self.store(key,value)
+
+        if isinstance(value,dict):
+            for v in value.values():
+                v.flags.writeable = False
+        else:
+            value.flags.writeable = False
+
+        self.entries[key] = value
+        self.nbytes += size(value)
+        while self.nbytes > self.maxbytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= size(old)
+
+        return value
+
+    def discard(self,data_type):
+        """Drops every entry of the given data type, in memory and on disk"""
+        for key in [ k for k in self.entries if k[0] == data_type ]:
+            self.nbytes -= size(self.entries.pop(key))
+
+        if self.path is None:
+            return
+        for stale in glob.glob(os.path.join(self.path, f'{data_type}_*.npz')):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    def stats(self):
+        return "{} hits, {} loaded from disk, {} misses".format(
+            self.hits, self.loads, self.misses)
+
+    def filename(self,key):
+        data_type, timestamp = key[:2]
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.path, f'{data_type}_{timestamp:.0f}_{digest}.npz')
+
+    def load(self,key):
+        if self.path is None or key[1] is None:
+            return None
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as npz:
+                if 'names' in npz:
+                    return dict(zip(npz['names'].tolist(), npz['values']))
+                return npz['value']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # truncated or corrupt entry (e.g. an interrupted run), compute it again
+            print("Ignoring unreadable derived series {} ({})".format(filename, e))
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return None
+
+    def store(self,key,value):
+        """
+        Writes the value to disk, removing any entries of the same data type
+        that were derived from a different version of the data set
+        """
+        if self.path is None or key[1] is None:
+            return
+
+        os.makedirs(self.path,exist_ok=True)
+
+        filename = self.filename(key)
+        prefix   = os.path.join(self.path, f'{key[0]}_{key[1]:.0f}_')
+        for stale in glob.glob(os.path.join(self.path, f'{key[0]}_*.npz')):
+            if not stale.startswith(prefix):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+        # unique name, as other processes may be storing the same entry
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp_', suffix='.npz')
+        try:
+            with os.fdopen(fd,'wb') as fp:
+                if isinstance(value,dict):
+                    names  = np.array(list(value.keys()), dtype=str)
+                    values = np.array(list(value.values()))
+                    np.savez(fp, names=names, values=values)
+                else:
+                    np.savez(fp, value=value)
+            os.replace(tmp, filename)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+def size(value):
+    """Number of bytes of the array(s) of a cached value"""
+    if isinstance(value,dict):
+        return sum( v.nbytes for v in value.values() )
+    return value.nbytes
@@ -0,0 +1,313 @@
+"""
+Export of the processed JHU data sets for use by other tools
+
+This file can be imported and contains the following functions:
+
+    * run      - exports the data sets named on the command line
+    * tables   - returns the arrays making up the export of a DataSet
+    * export   - writes (or appends to) the export of a DataSet
+
+The npy format (the default) writes one directory per data type holding:
+
+    dates.npy       - datetime64[D] date of each row of the raw matrices
+    weeks.npy       - datetime64[D] end of each week of the weekly matrices
+    counties.npy    - county name of each column of the county matrices
+    fips.npy        - FIPS code of each column of the county matrices
+    population.npy  - population of each column of the county matrices
+    county_state.npy- state code of each column of the county matrices
+    states.npy      - state code of each column of the state matrices
+    state_population.npy - population of each column of the state matrices
+    county_raw.npy, county_daily.npy, county_weekly.npy
+    state_raw.npy,  state_daily.npy,  state_weekly.npy
+
+The matrices are (n_days, n_regions), one row per day, in C order.  They
+can be memory-mapped with np.load(..., mmap_mode='r') and a new day is
+simply appended to the end of the file.  The daily matrices start on the
+second date.  The npz format puts the same arrays into a single
+(uncompressed) .npz file, which is always written in full (-append is
+not supported).
+
+The parquet and feather formats (which need pyarrow) write one table per
+matrix in long format (state[, county, fips], date, value).  Each table
+is a directory of part files, so that new days can be added as a new
+part.  Feather files are uncompressed so they can be memory-mapped.
+
+With -append, only the days that are not in an earlier export are
+written.  This requires the earlier days and regions to be unchanged.
+The weekly matrices are always rewritten, because the weeks are counted
+back from the last day.
+"""
+
+import glob
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+
+import support.jhu_data as jhu
+import support.states as sst
+
+formats = ['npy','npz','parquet','feather']
+
+levels      = ['county','state']
+frequencies = ['raw','daily','weekly']
+
+
+def run(args):
+    """Exports each data type in args.data_type to args.directory"""
+    if args.append and args.format == 'npz':
+        print("\n-append is not supported for the npz format\n")
+        sys.exit(1)
+
+    jhu_data = jhu.JHUData(args.max_age, args.source)
+    jhu_data.load(args.data_type)
+
+    for data_type in args.data_type:
+        export(jhu_data[data_type], data_type, args.directory, args.format, args.append)
+
+
+def tables(data):
+    """
+    Returns a dict of the arrays (by name, see above) exported for the
+    DataSet data
+    """
+    state_codes = np.array(data.state_codes)
+
+    rval = dict(
+        dates        = data.dates,
+        weeks        = data.weeks,
+        counties     = data.counties,
+        fips         = data.fips,
+        population   = data.population,
+        county_state = state_codes[data.state_index],
+        states       = state_codes,
+        state_population = np.array([ sst.abbrev_population[x] for x in state_codes ]),
+    )
+
+    for freq in frequencies:
+        view = getattr(data, freq)
+        rval['county_' + freq] = np.ascontiguousarray(view.county.matrix.T)
+        rval['state_'  + freq] = np.ascontiguousarray(view.state.matrix.T)
+
+    return rval
+
+
+def export(data, data_type, directory, format='npy', append=False):
+    """
+    Writes the export of the DataSet data to directory
+
+    With append, only the days which are not in the previous export are
+    written (if the previous export can be extended, see above).
+    """
+    arrays = tables(data)
+
+    if format == 'npz':
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, data_type + '.npz')
+        tmp  = os.path.join(directory, data_type + '.tmp.npz')
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        print("Exported {} data ({} days) to {}".format(data_type, data.dates.size, path))
+        return
+
+    if format == 'npy':
+        write = write_npy
+    elif format in ['parquet','feather']:
+        try:
+            import pyarrow
+        except ImportError:
+            print("\npyarrow is needed to export to " + format + "\n")
+            sys.exit(1)
+        write = write_arrow
+    else:
+        raise ValueError(format)
+
+    path = os.path.join(directory, data_type)
+    os.makedirs(path, exist_ok=True)
+
+    index = {
+        'format'  : format,
+        'dates'   : np.datetime_as_string(data.dates).tolist(),
+        'regions' : digest(data.fips, data.counties, data.state_index),
+        'counts'  : digest(data.counts),
+    }
+
+    nold = old_days(path, index, data) if append else 0
+    if append and nold == 0:
+        print("Previous export of {} data cannot be extended, rewriting it".format(data_type))
+
+    # an interrupted export must not be mistaken for a complete one
+    if os.path.exists(os.path.join(path, 'export.json')):
+        os.remove(os.path.join(path, 'export.json'))
+
+    for name in ['dates','weeks','counties','fips','population',
+                 'county_state','states','state_population']:
+        save_npy(os.path.join(path, name + '.npy'), arrays[name])
+
+    for level in levels:
+        labels = level_labels(arrays, level)
+        for freq in frequencies:
+            name   = level + '_' + freq
+            matrix = arrays[name]
+            if freq == 'raw':
+                dates, first = arrays['dates'], nold
+            elif freq == 'daily':
+                dates, first = arrays['dates'][1:], max(nold-1, 0)
+            else:
+                dates, first = arrays['weeks'], 0
+            write(path, format, name, matrix, dates, labels, first)
+
+    with open(os.path.join(path, 'export.json'), 'w') as fp:
+        json.dump(index, fp)
+
+    if nold:
+        print("Appended {} day(s) to the export of {} data in {}".format(
+            data.dates.size - nold, data_type, path))
+    else:
+        print("Exported {} data ({} days) to {}".format(data_type, data.dates.size, path))
+
+
+def digest(*arrays):
+    """SHA1 hex digest of the contents of arrays"""
+    sha = hashlib.sha1()
+    for x in arrays:
+        sha.update(np.ascontiguousarray(x).tobytes())
+    return sha.hexdigest()
+
+
+def old_days(path, index, data):
+    """
+    Returns the number of days in the previous export in path that can be
+    kept as they are (0 if the export has to be rewritten)
+    """
+    try:
+        with open(os.path.join(path, 'export.json')) as fp:
+            old = json.load(fp)
+    except (OSError, ValueError):
+        return 0
+
+    nold = len(old['dates'])
+    if ( old['format'] != index['format']
+         or old['regions'] != index['regions']
+         or nold < 2 or nold > data.dates.size
+         or old['dates'] != index['dates'][:nold]
+         or old['counts'] != digest(data.counts[:,:nold]) ):
+        return 0
+
+    return nold
+
+
+def level_labels(arrays, level):
+    """Columns identifying the region of each column of a level's matrices"""
+    if level == 'county':
+        return dict(state=arrays['county_state'], county=arrays['counties'],
+                    fips=arrays['fips'])
+    return dict(state=arrays['states'])
+
+
+def save_npy(path, array):
+    """Writes array to path under a temporary name and moves it into place"""
+    tmp = path[:-len('.npy')] + '.tmp.npy'
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def append_npy(path, rows):
+    """
+    Appends rows to the 2-D array in the .npy file path, which must have
+    the same number of columns and the same dtype
+
+    The file is copied to a temporary name, extended there and moved into
+    place, so an interrupted append leaves the old file as it was.  Returns
+    False (without touching the file) if the array cannot be extended.
+    """
+    fmt = np.lib.format
+    try:
+        with open(path, 'rb') as fp:
+            version = fmt.read_magic(fp)
+            if version != (1,0):
+                return False
+            shape, fortran, dtype = fmt.read_array_header_1_0(fp)
+            offset = fp.tell()
+    except (OSError, ValueError):
+        return False
+
+    if fortran or dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+        return False
+
+    header = dict(descr=fmt.dtype_to_descr(dtype), fortran_order=False,
+                  shape=(shape[0] + rows.shape[0],) + shape[1:])
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp.npy')
+    try:
+        with os.fdopen(fd, 'r+b') as fp:
+            with open(path, 'rb') as old:
+                shutil.copyfileobj(old, fp)
+            fp.seek(0)
+            fmt.write_array_header_1_0(fp, header)
+            if fp.tell() != offset:
+                # older numpy versions do not leave room for the shape to grow
+                os.remove(tmp)
+                return False
+
+            fp.seek(offset + shape[0] * rows[0].nbytes)
+            fp.truncate()
+            fp.write(np.ascontiguousarray(rows).tobytes())
+        os.replace(tmp, path)
+        return True
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_npy(path, format, name, matrix, dates, labels, first=0):
+    """Writes (rows first onwards of) a matrix as a .npy file"""
+    filename = os.path.join(path, name + '.npy')
+    if first == len(matrix):
+        return
+    if first == 0 or not append_npy(filename, matrix[first:]):
+        save_npy(filename, matrix)
+
+
+def write_arrow(path, format, name, matrix, dates, labels, first=0):
+    """
+    Writes rows first onwards of a matrix as a new part of a table in long
+    format (removing the old parts if first is 0)
+    """
+    import pyarrow as pa
+
+    table_dir = os.path.join(path, name)
+    os.makedirs(table_dir, exist_ok=True)
+    if first == 0:
+        for part in glob.glob(os.path.join(table_dir, 'part-*')):
+            os.remove(part)
+
+    matrix = matrix[first:]
+    dates  = dates[first:]
+    ndates, nregion = matrix.shape
+    if ndates == 0:
+        return
+
+    columns = dict()
+    for k,v in labels.items():
+        if v.dtype.kind == 'U':
+            codes = np.tile(np.arange(nregion, dtype=np.int32), ndates)
+            columns[k] = pa.DictionaryArray.from_arrays(codes, pa.array(v))
+        else:
+            columns[k] = pa.array(np.tile(v, ndates))
+    columns['date']  = pa.array(np.repeat(dates, nregion))
+    columns['value'] = pa.array(matrix.reshape(-1))
+
+    table = pa.table(columns)
+    filename = os.path.join(table_dir, 'part-{:05d}.{}'.format(first, format))
+
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, filename)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, filename, compression='uncompressed')
@@ -0,0 +1,280 @@
+"""
+Reusable figures for the grid (small multiples) plots
+
+This file can be imported and contains the following classes and functions:
+
+    * GridFigure     - figure with one small plot per region in a grid layout
+    * GridCollection - the same figure drawn with a handful of artists (-fast)
+    * grid           - returns a pooled grid figure for a layout, creating it once
+
+Creating the axes of a 7x11 grid costs far more than drawing it, so the
+figures used for saved plots are kept in a small pool and each new variant
+(raw, per capita, common scale, deaths, ...) only replaces the line data,
+limits and texts of the existing artists.
+
+Even so, a GridFigure has a full set of axes (spines, ticks, ...) per
+region, so its draw time grows quickly with the number of regions (e.g.
+the 254 counties of Texas).  GridCollection draws the lines of all the
+regions as one LineCollection per data type, and their frames as another,
+in a single axes covering the figure.  It looks the same, except that
+values outside a region's y range are clipped to it rather than cut off
+at its frame.
+"""
+
+import numpy as np
+
+from collections import OrderedDict
+
+figsize = (12,8)
+
+maxsize = 8
+pool = OrderedDict()
+
+
+class GridFigure:
+    """
+    Figure with a grid of axes, one per region, whose lines and texts are
+    created on the first draw and updated in place on later draws
+
+    Attributes:
+        fig    - the matplotlib figure
+        axes   - dict of axes by region name
+        lines  - dict of lists of lines by region name
+        labels - dict of lists of region labels by region name
+        notes  - footer annotations (timespan, y span)
+    """
+    def __init__(self,layout,label_xy,label_size,pyplot=False):
+        layout = np.asarray(layout)
+        nrow, ncol = layout.shape
+
+        if pyplot:
+            import matplotlib.pyplot as plt
+            self.fig, axs = plt.subplots(nrow, ncol, squeeze=False)
+        else:
+            # Not registered with pyplot, so plt.close('all') leaves it alone
+            from matplotlib.figure import Figure
+            self.fig = Figure()
+            axs = self.fig.subplots(nrow, ncol, squeeze=False)
+
+        self.fig.set_size_inches(*figsize)
+
+        self.label_xy   = label_xy
+        self.label_size = label_size
+        self.axes   = dict()
+        self.lines  = dict()
+        self.labels = dict()
+        self.notes  = None
+
+        for region, ax in zip(layout.reshape(-1), axs.reshape(-1)):
+            if region == '':
+                ax.axis('off')
+            else:
+                self.axes[region] = ax
+
+        self.corner = axs[nrow-1,ncol-1]
+
+    def panel(self,region,xs,ys,ymax,label):
+        """
+        Draws one line per (x,y) pair in the plot for region, with the
+        y axis running from 0 to ymax and the region label in the corner
+        """
+        ax = self.axes[region]
+
+        if region not in self.lines:
+            self.lines[region]  = []
+            self.labels[region] = []
+            for x,y in zip(xs,ys):
+                self.lines[region] += ax.plot(x,y)
+                ax.set_ylim(0,ymax)
+                ax.set_xticks([])
+                ax.set_yticks([])
+                self.labels[region].append(ax.annotate(
+                    label, self.label_xy, xycoords='axes fraction',
+                    fontsize=self.label_size))
+            return
+
+        for line,x,y in zip(self.lines[region],xs,ys):
+            line.set_data(x,y)
+        for text in self.labels[region]:
+            text.set_text(label)
+        ax.set_ylim(0,ymax)
+        ax.relim()
+        ax.autoscale_view(scaley=False)
+
+    def footer(self,timespan,y_span):
+        """Sets the timespan (bottom right) and y span (bottom left) notes"""
+        if self.notes is None:
+            self.notes = (
+                self.corner.annotate(timespan,
+                    xy=(1,0), xycoords='figure fraction',
+                    xytext=(-5,5), textcoords='offset points',
+                    ha='right', va='bottom',
+                    fontsize='x-small',
+                    ),
+                self.corner.annotate(y_span,
+                    xy=(0,0), xycoords='figure fraction',
+                    xytext=(5,5), textcoords='offset points',
+                    ha='left', va='bottom',
+                    fontsize='x-small',
+                    ),
+                )
+        else:
+            self.notes[0].set_text(timespan)
+            self.notes[1].set_text(y_span)
+
+    def suptitle(self,title):
+        self.fig.suptitle(title)
+
+    def savefig(self,filename,**kwargs):
+        self.fig.savefig(filename,**kwargs)
+
+
+class GridCollection:
+    """
+    Drop-in replacement for GridFigure which draws all of the regions into
+    a single axes, with one LineCollection per data type
+
+    The lines of a region are scaled into the box its axes would have had
+    in a GridFigure.  The collections are updated once every region has
+    been drawn (or when the figure is saved).
+    """
+    def __init__(self,layout,label_xy,label_size,pyplot=False):
+        from matplotlib.collections import LineCollection
+        from matplotlib.gridspec import GridSpec
+
+        layout = np.asarray(layout)
+        nrow, ncol = layout.shape
+
+        if pyplot:
+            import matplotlib.pyplot as plt
+            self.fig = plt.figure()
+        else:
+            from matplotlib.figure import Figure
+            self.fig = Figure()
+
+        self.fig.set_size_inches(*figsize)
+
+        bottoms, tops, lefts, rights = GridSpec(nrow, ncol, figure=self.fig).get_grid_positions(self.fig)
+        self.boxes = dict()
+        for (row,col), region in np.ndenumerate(layout):
+            if region != '':
+                self.boxes[region] = (lefts[col], bottoms[row],
+                                      rights[col]-lefts[col], tops[row]-bottoms[row])
+
+        # a single axes whose data coordinates are figure fractions
+        self.ax = self.fig.add_axes([0,0,1,1])
+        self.ax.set_axis_off()
+        self.ax.set_xlim(0,1)
+        self.ax.set_ylim(0,1)
+
+        frames = [ [(x,y), (x+w,y), (x+w,y+h), (x,y+h), (x,y)]
+                   for x,y,w,h in self.boxes.values() ]
+        self.ax.add_collection(LineCollection(frames,
+            colors='black', linewidths=0.8, snap=True, joinstyle='miter', zorder=2.5))
+
+        self.label_xy    = label_xy
+        self.label_size  = label_size
+        self.collections = []
+        self.segments    = []
+        self.pending     = set()
+        self.labels      = dict()
+        self.notes       = None
+
+    def panel(self,region,xs,ys,ymax,label):
+        """
+        Draws one line per (x,y) pair in the box for region, with the y
+        axis running from 0 to ymax and the region label in the corner
+        """
+        from matplotlib.collections import LineCollection
+        import matplotlib.dates as mdates
+
+        left, bottom, width, height = self.boxes[region]
+
+        xs = [ mdates.date2num(x) if np.asarray(x).dtype.kind == 'M' else np.asarray(x)
+               for x in xs ]
+        lo = min( x.min() for x in xs )
+        hi = max( x.max() for x in xs )
+        margin = 0.05 * (hi - lo)
+        lo, hi = lo - margin, hi + margin
+
+        for i,(x,y) in enumerate(zip(xs,ys)):
+            if i == len(self.collections):
+                self.segments.append(dict())
+                self.collections.append(self.ax.add_collection(LineCollection([],
+                    colors='C{}'.format(i), linewidths=1.5,
+                    capstyle='projecting', joinstyle='round', zorder=2)))
+            self.segments[i][region] = np.column_stack([
+                left + (x - lo) / (hi - lo) * width,
+                bottom + np.clip(y, 0, ymax) / ymax * height ])
+
+        lx, ly = self.label_xy
+        if region not in self.labels:
+            self.labels[region] = self.ax.text(left + lx*width, bottom + ly*height,
+                label, fontsize=self.label_size)
+        else:
+            self.labels[region].set_text(label)
+
+        self.pending.add(region)
+        if len(self.pending) == len(self.boxes):
+            self.update()
+
+    def update(self):
+        """Hands the lines drawn since the last update to the collections"""
+        for collection, segments in zip(self.collections, self.segments):
+            collection.set_segments(list(segments.values()))
+        self.pending.clear()
+
+    def footer(self,timespan,y_span):
+        """Sets the timespan (bottom right) and y span (bottom left) notes"""
+        if self.notes is None:
+            self.notes = (
+                self.ax.annotate(timespan,
+                    xy=(1,0), xycoords='figure fraction',
+                    xytext=(-5,5), textcoords='offset points',
+                    ha='right', va='bottom',
+                    fontsize='x-small',
+                    ),
+                self.ax.annotate(y_span,
+                    xy=(0,0), xycoords='figure fraction',
+                    xytext=(5,5), textcoords='offset points',
+                    ha='left', va='bottom',
+                    fontsize='x-small',
+                    ),
+                )
+        else:
+            self.notes[0].set_text(timespan)
+            self.notes[1].set_text(y_span)
+
+    def suptitle(self,title):
+        self.fig.suptitle(title)
+
+    def savefig(self,filename,**kwargs):
+        if self.pending:
+            self.update()
+        self.fig.savefig(filename,**kwargs)
+
+
+def grid(layout,nlines,label_xy,label_size,pooled=True,fast=False):
+    """
+    Returns the GridFigure (or with fast, the GridCollection) for layout
+    (a 2D array of region names, with '' for empty cells) and nlines lines
+    per region
+
+    Unless pooled is False (e.g. for figures that will be shown on screen)
+    the figure is taken from, or added to, the pool of reusable figures.
+    """
+    kind = GridCollection if fast else GridFigure
+
+    if not pooled:
+        return kind(layout,label_xy,label_size,pyplot=True)
+
+    key = (tuple(map(tuple,np.asarray(layout))), nlines, tuple(label_xy), label_size, fast)
+    if key in pool:
+        pool.move_to_end(key)
+        return pool[key]
+
+    pool[key] = kind(layout,label_xy,label_size)
+    if len(pool) > maxsize:
+        pool.popitem(last=False)
+
+    return pool[key]
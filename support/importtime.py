@@ -0,0 +1,49 @@
+"""
+Start-up time measurement for the covidplot command
+
+This file can be imported and contains the following functions:
+
+    * report - reruns a command line under -X importtime and summarizes it
+"""
+
+import subprocess
+import sys
+
+
+def report(argv, top=15):
+    """
+    Reruns the covidplot command line argv (without -importtime) in a fresh
+    interpreter with python's -X importtime option and prints the slowest
+    imports by cumulative time, followed by the total import time
+
+    Returns the exit status of the rerun command
+    """
+    argv = [ x for x in argv if x != '-importtime' ]
+    rq = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + argv,
+        stderr=subprocess.PIPE, text=True)
+
+    imports = list()
+    errors  = list()
+    for line in rq.stderr.splitlines():
+        if not line.startswith('import time:'):
+            errors.append(line)
+            continue
+        fields = line[len('import time:'):].split('|')
+        if fields[0].strip().isdigit():
+            imports.append((int(fields[1]), int(fields[0]), fields[2][1:]))
+
+    if errors:
+        print('\n'.join(errors), file=sys.stderr)
+
+    # only top level imports count towards the total, their cumulative
+    # times already include everything they imported in turn
+    total = sum(x[0] for x in imports if not x[2].startswith(' '))
+
+    print(f"\nSlowest imports ({len(imports)} modules imported):\n")
+    print("  {:>10s} {:>10s}  {}".format('cumul(ms)','self(ms)','module'))
+    for cumul, own, name in sorted(imports, reverse=True)[:top]:
+        print("  {:10.1f} {:10.1f}  {}".format(cumul/1000, own/1000, name.strip()))
+    print("\n  {:10.1f} ms total import time".format(total/1000))
+
+    return rq.returncode
@@ -0,0 +1,179 @@
+"""
+Building blocks for pipelined (streaming) ingest of the JHU files
+
+This file can be imported and contains the following classes and functions:
+
+    * read_ahead - iterates over chunks read by a background thread
+    * batches    - regroups chunks of bytes into batches of complete lines
+    * Columns    - arrays of rows which are filled one batch at a time
+    * Progress   - keeps track of the throughput of a stream
+
+The reader thread keeps a bounded number of chunks queued up, so that the
+parser can work on the rows received so far while the rest of the file is
+still being downloaded.
+"""
+
+import numpy as np
+import sys
+import threading
+import time
+
+from queue import Queue, Empty
+
+
+def read_ahead(chunks, depth=64, progress=None):
+    """
+    Iterates over chunks, which are read up to depth chunks ahead of the
+    caller by a background thread
+
+    If a Progress is given it is told about every chunk as it arrives.
+    Exceptions raised while reading are raised again in the caller.
+    """
+    queue = Queue(depth)
+    stop  = threading.Event()
+
+    def reader():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                if progress is not None:
+                    progress.received(len(chunk))
+                queue.put((chunk,None))
+            if progress is not None:
+                progress.downloaded()
+            queue.put((None,None))
+        except BaseException as e:
+            queue.put((None,e))
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            chunk, error = queue.get()
+            if error is not None:
+                raise error
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        # unblock the reader if the caller gave up early
+        stop.set()
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        thread.join()
+
+
+def batches(chunks, size):
+    """
+    Regroups chunks of bytes into batches of at least size bytes (except
+    for the last one) which end at a line break
+    """
+    pending = []
+    npending = 0
+
+    for chunk in chunks:
+        pending.append(chunk)
+        npending += len(chunk)
+        if npending < size:
+            continue
+
+        data = b''.join(pending)
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            pending = [data]
+            continue
+
+        yield data[:end]
+        pending = [data[end:]]
+        npending = len(pending[0])
+
+    if npending:
+        yield b''.join(pending)
+
+
+class Columns(dict):
+    """
+    Dict of arrays (by column name) which are filled in batches of rows
+
+    The arrays are allocated for the expected number of rows when the first
+    batch arrives and are doubled in size whenever a batch does not fit.
+    """
+    def __init__(self,capacity=1024):
+        self.capacity = max(1,capacity)
+        self.nrow = 0
+
+    def append(self,**batch):
+        nrow = len(next(iter(batch.values())))
+        end  = self.nrow + nrow
+
+        if end > self.capacity:
+            self.capacity = max(end, 2*self.capacity)
+            for k,v in self.items():
+                grown = np.empty((self.capacity,) + v.shape[1:], v.dtype)
+                grown[:self.nrow] = v[:self.nrow]
+                self[k] = grown
+
+        for k,v in batch.items():
+            v = np.asarray(v)
+            if k not in self:
+                self[k] = np.empty((self.capacity,) + v.shape[1:], v.dtype)
+            elif np.result_type(self[k],v) != self[k].dtype:
+                # e.g. longer strings than in the previous batches
+                self[k] = self[k].astype(np.result_type(self[k],v))
+            self[k][self.nrow:end] = v
+
+        self.nrow = end
+
+    def arrays(self):
+        """Returns the filled part of each array"""
+        return { k : v[:self.nrow] for k,v in self.items() }
+
+
+class Progress:
+    """
+    Keeps track of the bytes received and the rows parsed from a stream
+    and reports the throughput once the stream is done
+
+    The progress is also shown while the stream is running when the output
+    is a terminal.
+    """
+    def __init__(self,label,total=None):
+        self.label  = label
+        self.total  = total
+        self.nbytes = 0
+        self.nrows  = 0
+        self.start  = time.perf_counter()
+        self.end_of_download = None
+        self.shown  = self.start
+        self.tty    = sys.stdout.isatty()
+
+    def received(self,nbytes):
+        self.nbytes += nbytes
+
+    def downloaded(self):
+        self.end_of_download = time.perf_counter()
+
+    def parsed(self,nrows):
+        self.nrows += nrows
+        now = time.perf_counter()
+        if self.tty and now - self.shown > 0.5:
+            self.shown = now
+            done = "" if not self.total else " ({:.0f}%)".format(
+                min(100, 100*self.nbytes/self.total))
+            print("\rStreaming {} data: {:.1f} MB{}, {:,} rows".format(
+                self.label, self.nbytes/1e6, done, self.nrows), end='', flush=True)
+
+    def report(self):
+        now = time.perf_counter()
+        elapsed = max(now - self.start, 1e-9)
+        parse_tail = now - (self.end_of_download or now)
+        print("{}Streamed {} data: {:.1f} MB, {:,} rows in {:.2f}s "
+              "({:.1f} MB/s, {:,.0f} rows/s, {:.2f}s parsing after the download)".format(
+                  "\r" if self.tty else "",
+                  self.label, self.nbytes/1e6, self.nrows, elapsed,
+                  self.nbytes/1e6/elapsed, self.nrows/elapsed, parse_tail))
@@ -6,30 +6,113 @@ This file can be imported and contains the following functions:
     * get_data:  Return JHU data
 """
 
+import copy
 import csv
+import io
+import json
 import numpy as np
-import pickle
-import re
-import requests
+import os
 import support.counties as counties
+import support.ingest as ingest
+import support.profile as profile
+import support.smoothing as smoothing
+import support.sources as sources
 import support.states as states
+import support.util as su
 import time
+import zlib
 
-from contextlib import closing
+from collections.abc import Mapping
+from support.derived import DerivedCache
+from support.sources import IncorrectURL
 
-class IncorrectURL(Exception):
-    pass
+data_types = ['deaths','confirmed']
 
-class JHUData(dict):
-    def __init__(self,max_age=None):
-        data = cached_data(max_age)
-
-        if data == None:
-            data = { k : download_data(k) for k in ['deaths','confirmed'] }
-            cache_data(data)
+# data types whose file gives the population of each county
+population_types = ['deaths']
 
-        for k,v in data.items():
-            self[k] = v
+class JHUData(dict):
+    """
+    The JHU data sets keyed by data type (deaths or confirmed)
+
+    Each data set is loaded the first time it is looked up (or when it is
+    named in a call to load), so plots of a single data type never touch
+    the other one.  With processes=False the data sets are downloaded by
+    threads rather than processes (e.g. in a process that must not fork).
+    """
+    def __init__(self,max_age=None,source=None,memo=False,processes=True):
+        self.max_age   = max_age
+        self.source    = source
+        self.processes = processes
+        self.derived   = DerivedCache(path=derived_dir if memo else None)
+
+    def __missing__(self,data_type):
+        if data_type not in data_types:
+            raise KeyError(data_type)
+        self.load([data_type])
+        return self[data_type]
+
+    def load(self,types=data_types):
+        """
+        Loads any of the given data types that have not been loaded yet
+
+        Data sets found in the cache (and not older than max_age) are opened
+        from there; the others are downloaded concurrently and cached.
+        """
+        loaded   = []
+        download = []
+        for k in types:
+            if k in self.keys():
+                continue
+            with profile.stage('cache load'):
+                data = cached_data(k,self.max_age)
+            if data is None:
+                download.append(k)
+            else:
+                self[k] = data
+                loaded.append(k)
+
+        if download:
+            source = sources.get_source(self.source)
+            with profile.stage('download'):
+                cached = { k : load_cache(k) for k in download }
+                downloaded = download_all(download,cached,source,self.processes)
+            for k,data in downloaded.items():
+                with profile.stage('cache save'):
+                    cache_data(k,data)
+                self[k] = data
+
+            # The deaths time series comes with the population of each county
+            if 'deaths' in download:
+                counties.update_index(self['deaths'].fips, self['deaths'].population)
+                loaded = list(self.keys())
+            else:
+                loaded += download
+
+        for k in loaded:
+            self.resolve_population(k)
+
+    def resolve_population(self,data_type):
+        """
+        Takes the population of the counties of a data set from the FIPS
+        population index
+
+        A data set parsed before the index held all of its counties (e.g.
+        confirmed cases downloaded before the deaths) falls back to other
+        populations, so these are corrected, in the cache too, once the
+        index has them.  Any derived series of the data set are dropped.
+        """
+        data = self[data_type]
+        population = counties.indexed_population(data.fips, data.population)
+        if np.array_equal(population, data.population):
+            return
+
+        data.population = population
+        self.derived.discard(data_type)
+        try:
+            data.save(os.path.join(cache_dir,data_type))
+        except Exception:
+            print("Failed to cache the corrected " + data_type + " populations")
 
     def __getattr__(self,k):
         if hasattr(self,k):
@@ -42,29 +125,49 @@ class JHUData(dict):
                        data_type='confirmed',
                        frequency=None,
                        smooth=None,
-                       yscale=None):
+                       yscale=None,
+                       kernel='trailing'):
         if isinstance(data_type,list):
+            self.load(data_type)
             rval = dict()
             for dt in data_type:
                 rval[dt] = self.get_state_data(
-                    state, data_type=dt, frequency=frequency, smooth=smooth, yscale=yscale)
+                    state, data_type=dt, frequency=frequency, smooth=smooth, yscale=yscale,
+                    kernel=kernel)
 
         else:
-            rval = self[data_type]
-            if frequency=='daily':
-                rval = rval.daily.state[state]
-            elif frequency=='weekly':
-                rval = rval.weekly.state[state]
-            else:
-                rval = rval.raw.state[state]
+            key = self.derived_key('state', state, data_type, frequency, smooth, yscale, kernel)
+            rval = self.derived.get(key, lambda: self.derive_state_data(state, data_type, *key[4:]))
+
+        return rval
 
-            if smooth and smooth>1:
-                c = np.ones(smooth)/smooth
-                rval = np.convolve(rval, c, mode='valid')
+    def derived_key(self,level,region,data_type,frequency,smooth,yscale,kernel):
+        """
+        Key for the derived series cache (see support.derived)
+
+        Arguments which do not change the derived series are normalized
+        so that equivalent requests share an entry.
+        """
+        if frequency not in ['daily','weekly']:
+            frequency = 'raw'
+        if not smooth or smooth <= 1:
+            smooth = None
+            kernel = None
+        if yscale != 'per_capita':
+            yscale = None
+        return (data_type, self[data_type].timestamp,
+                level, region, frequency, smooth, yscale, kernel)
+
+    def derive_state_data(self,state,data_type,frequency,smooth,yscale,kernel):
+        with profile.stage('derive'):
+            rval = getattr(self[data_type],frequency).state[state]
+
+            if smooth:
+                rval = smoothing.smooth(rval, smooth, kernel)
 
             if yscale == 'per_capita':
                 pop = states.abbrev_population[state]
-                rval /= pop
+                rval = rval / pop
 
         return rval
 
@@ -76,34 +179,22 @@ class JHUData(dict):
                         data_type='confirmed',
                         frequency=None,
                         smooth=None,
-                        yscale=None):
+                        yscale=None,
+                        kernel='trailing'):
         is_list = isinstance(data_type,list)
 
         if not is_list:
             data_type = [data_type]
 
+        self.load(data_type)
+
         rval = dict()
 
         for dt in data_type:
-            if frequency=='daily':
-                cd = self[dt].daily.county[state]
-            elif frequency=='weekly':
-                cd = self[dt].weekly.county[state]
-            else:
-                cd = self[dt].raw.county[state]
+            key = self.derived_key('county', state, dt, frequency, smooth, yscale, kernel)
+            cd = self.derived.get(key, lambda: self.derive_county_data(state, dt, *key[4:]))
 
             for county,data in cd.items():
-                if re.match('^Out of',county) or county == 'Unassigned':
-                    continue
-
-                if smooth and smooth>1:
-                    c = np.ones(smooth)/smooth
-                    data = np.convolve(data, c, mode='valid')
-
-                if yscale == 'per_capita':
-                    pop = counties.population(county,state)
-                    data /= pop
-
                 if county in rval.keys():
                     rval[county][dt] = data
                 elif is_list:
@@ -114,16 +205,76 @@ class JHUData(dict):
 
         return rval
 
+    def derive_county_data(self,state,data_type,frequency,smooth,yscale,kernel):
+        with profile.stage('derive'):
+            data = self[data_type]
+
+            names, block = getattr(data,frequency).county.block(state)
+            start, stop  = data.rows(state)
+
+            keep  = data.assigned(start, stop)
+            names = names[keep].tolist()
+            block = block[keep]
+
+            if smooth:
+                block = smoothing.smooth(block, smooth, kernel)
+
+            if yscale == 'per_capita':
+                pop = data.county_population(start, stop)
+                block = block / pop[:,np.newaxis]
+
+        return dict(zip(names, block))
+
+    def get_county_matrix(self,
+                          data_type='confirmed',
+                          frequency=None,
+                          smooth=None,
+                          yscale=None,
+                          kernel='trailing'):
+        """
+        Returns the state code and name of every county in the country and
+        a (n_counties, n_values) array of their data, derived from the whole
+        county matrix at once
+
+        As in get_county_data, the 'Out of XX' and 'Unassigned' entries are
+        left out.  The counties are ordered by state.
+        """
+        data = self[data_type]
+        keep = data.assigned()
+
+        key = self.derived_key('county', None, data_type, frequency, smooth, yscale, kernel)
+        matrix = self.derived.get(key, lambda: self.derive_county_matrix(data_type, *key[4:]))
+
+        states = np.array(data.state_codes)[data.state_index]
+        return states[keep], data.counties[keep], matrix
+
+    def derive_county_matrix(self,data_type,frequency,smooth,yscale,kernel):
+        with profile.stage('derive'):
+            data = self[data_type]
+            keep = data.assigned()
+
+            matrix = getattr(data,frequency).county.matrix[keep]
+
+            if smooth:
+                matrix = smoothing.smooth(matrix, smooth, kernel)
+
+            if yscale == 'per_capita':
+                matrix = matrix / data.county_population()[:,np.newaxis]
+
+        return matrix
+
     def get_dates(self, 
                   data_type='confirmed',
                   frequency=None,
-                  smooth=None):
+                  smooth=None,
+                  kernel='trailing'):
 
         if isinstance(data_type,list):
+            self.load(data_type)
             rval = dict()
             for dt in data_type:
                 rval[dt] = self.get_dates(
-                    data_type=dt, frequency=frequency, smooth=smooth)
+                    data_type=dt, frequency=frequency, smooth=smooth, kernel=kernel)
 
         else:
             if frequency=='daily':
@@ -133,122 +284,606 @@ class JHUData(dict):
             else:
                 rval = self[data_type].dates
 
-            if smooth and smooth>1:
-                rval = rval[smooth-1:]
+            first, last = smoothing.trimmed(smooth, kernel)
+            rval = rval[first:rval.size-last]
 
         return rval
 
 
 
-class StateData(dict):
-    def add(self,state, data):
-        if state not in self.keys():
-            self[state] = data
-        else:
-            self[state] = np.add(self[state],data)
-
-class CountyData(dict):
-    def add(self,state,county,data):
-        if state not in self.keys():
-            self[state] = dict()
-        self[state][county] = data
+class StateData(Mapping):
+    """
+    State totals derived from the county matrix of a DataSet
+
+    Each state is summed (and converted to the requested frequency) the
+    first time it is looked up.  The matrix property computes all of the
+    states at once with a single reduction.
+    """
+    def __init__(self,regional):
+        self.regional = regional
+        self.data     = regional.data
+        self.cache    = dict()
+
+    def __getitem__(self,state):
+        if state not in self.cache:
+            start, stop = self.data.rows(state)
+            total = self.data.counts[start:stop].sum(axis=0,dtype=np.int64)
+            self.cache[state] = self.regional.derive(total[np.newaxis,:])[0]
+        return self.cache[state]
+
+    def __iter__(self):
+        return iter(self.data.state_codes)
+
+    def __len__(self):
+        return len(self.data.state_codes)
+
+    @property
+    def matrix(self):
+        """(n_states, n_values) array of all state totals"""
+        offsets = self.data.state_offsets[:-1]
+        totals  = np.add.reduceat(self.data.counts, offsets, axis=0, dtype=np.int64)
+        return self.regional.derive(totals)
+
+class CountyData(Mapping):
+    """
+    County data derived from the county matrix of a DataSet
+
+    Looking up a state returns a dict of county name to data, where the data
+    for each county is a row of the state's block of the (derived) matrix.
+    """
+    def __init__(self,regional):
+        self.regional = regional
+        self.data     = regional.data
+        self.cache    = dict()
+        self.blocks   = dict()
+
+    def __getitem__(self,state):
+        if state not in self.cache:
+            self.cache[state] = dict(zip(*self.block(state)))
+        return self.cache[state]
+
+    def block(self,state):
+        """
+        Returns the county names of a state and a (n_counties, n_values)
+        array holding the data of those counties
+        """
+        if state not in self.blocks:
+            start, stop = self.data.rows(state)
+            self.blocks[state] = (self.data.counties[start:stop],
+                                  self.regional.derive(self.data.counts[start:stop]))
+        return self.blocks[state]
+
+    def __iter__(self):
+        return iter(self.data.state_codes)
+
+    def __len__(self):
+        return len(self.data.state_codes)
+
+    @property
+    def matrix(self):
+        """(n_counties, n_values) array of all county data"""
+        return self.regional.derive(self.data.counts)
 
 class RegionalData:
-    def __init__(self):
-        self.state  = StateData()
-        self.county = CountyData()
+    """
+    State and county views of a DataSet at a given frequency (raw, daily, weekly)
+    """
+    def __init__(self,data,frequency):
+        self.data      = data
+        self.frequency = frequency
+        self.state     = StateData(self)
+        self.county    = CountyData(self)
+
+    def derive(self,counts):
+        """Converts a block of cumulative counts (one row per region) to this frequency"""
+        if self.frequency == 'daily':
+            return np.diff(counts,axis=1)
+        elif self.frequency == 'weekly':
+            nweeks = self.data.weeks.size
+            return np.diff(counts[:,-1-7*nweeks::7],axis=1)
+        else:
+            return counts
 
 class DataSet:
-    def __init__(self,dates):
+    """
+    JHU time series for a single data type (deaths or confirmed)
+
+    The cumulative counts are held in a single (n_counties, n_days) int32
+    matrix with the counties of each state in consecutive rows.  The raw,
+    daily and weekly views (and their state totals) are derived from it
+    as they are needed.
+
+    Attributes:
+        dates         - datetime64[D] date of each column of the matrix
+        weeks         - datetime64[D] date of the end of each full week
+        counts        - (n_counties, n_days) matrix of cumulative counts
+        counties      - county name for each row of the matrix
+        fips          - FIPS code for each row of the matrix (0 if there is none)
+        population    - population for each row of the matrix
+        state_index   - index into state_codes for each row of the matrix
+        state_codes   - state postal codes in the order they appear in the matrix
+        state_offsets - first row of each state (plus the total number of rows)
+        validators    - what the source needs for a conditional fetch (see support.sources)
+        checksums     - CRC32 of the CSV line of each row of the matrix (None if unknown)
+        timestamp     - when the data set was cached
+    """
+    def __init__(self,dates,states,names,counts,fips=None,population=None,checksums=None):
+        self._set_dates(dates)
+        self.validators = None
+        self.timestamp  = None
+
+        self.state_codes, state_index, order = state_order(states)
+
+        self.state_index   = state_index[order]
+        self.counties      = np.asarray(names)[order]
+        self.counts        = np.asarray(counts, dtype=np.int32)[order]
+        self.state_offsets = np.searchsorted(
+            self.state_index, np.arange(len(self.state_codes)+1))
+
+        if fips is None:
+            fips = np.zeros(len(states))
+        if population is None:
+            population = np.full(len(states), counties.missing_population)
+
+        self.fips       = np.asarray(fips, dtype=np.int32)[order]
+        self.population = np.asarray(population, dtype=np.int64)[order]
+        self.checksums  = None if checksums is None else np.asarray(checksums, dtype=np.uint32)[order]
+
+        self._init_views()
+
+    def _set_dates(self,dates):
         ndays  = dates.size - 1
         nweeks = int(ndays/7)
 
         self.dates  = dates
         self.weeks  = dates[-7*nweeks + 6 : : 7]
 
-        self.raw    = RegionalData()
-        self.daily  = RegionalData()
-        self.weekly = RegionalData()
+    def _init_views(self):
+        self.raw    = RegionalData(self,'raw')
+        self.daily  = RegionalData(self,'daily')
+        self.weekly = RegionalData(self,'weekly')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['raw','daily','weekly']:
+            del state[k]
+        return state
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._init_views()
+
+    def save(self,path):
+        """
+        Writes the data set to the directory path
+
+        The arrays are stored as .npy files (so that they can be memory-mapped
+        by load) and everything else goes into a small JSON index.  Each file
+        is written under a unique temporary name and then moved into place
+        (see support.util.write_file) so that processes which still have the
+        old files mapped are not disturbed.
+        """
+        os.makedirs(path,exist_ok=True)
+
+        for name in ['counts','counties','fips','population','state_index','checksums']:
+            array = getattr(self,name)
+            if array is not None:
+                su.write_file(os.path.join(path, name + '.npy'), lambda fp: np.save(fp, array))
+            elif os.path.exists(os.path.join(path, name + '.npy')):
+                os.remove(os.path.join(path, name + '.npy'))
+
+        index = {
+            'dates'         : np.datetime_as_string(self.dates).tolist(),
+            'state_codes'   : self.state_codes,
+            'state_offsets' : self.state_offsets.tolist(),
+            'validators'    : self.validators,
+            'timestamp'     : self.timestamp,
+        }
+        su.write_file(os.path.join(path,'index.json'), lambda fp: json.dump(index,fp), 'w')
+
+    @classmethod
+    def load(cls,path):
+        """
+        Opens a data set written by save
+
+        The count matrix is memory-mapped, so only the pages holding the
+        rows that are actually used get read from disk.
+        """
+        with open(os.path.join(path,'index.json')) as fp:
+            index = json.load(fp)
+
+        data = cls.__new__(cls)
+        data._set_dates(np.array(index['dates'], dtype='datetime64[D]'))
+        data.validators = index.get('validators')
+        data.timestamp  = index['timestamp']
+
+        data.state_codes   = index['state_codes']
+        data.state_offsets = np.array(index['state_offsets'])
+        data.state_index   = np.load(os.path.join(path,'state_index.npy'))
+        data.counties      = np.load(os.path.join(path,'counties.npy'))
+        data.fips          = np.load(os.path.join(path,'fips.npy'))
+        data.population    = np.load(os.path.join(path,'population.npy'))
+        data.counts        = np.load(os.path.join(path,'counts.npy'), mmap_mode='r')
+        try:
+            data.checksums = np.load(os.path.join(path,'checksums.npy'))
+        except OSError:
+            data.checksums = None
+
+        data._init_views()
+
+        return data
+
+    def extend(self,dates,counts,checksums=None):
+        """
+        Returns a copy of the data set with additional date columns appended
+
+        counts (and the checksums of the extended rows) must hold one row
+        for each row of the matrix (in matrix order).  The daily and weekly
+        views of the copy are derived afresh, so only their new tail differs
+        from those of the original.
+        """
+        data = copy.copy(self)
+        data._set_dates(np.concatenate([self.dates,dates]))
+        data.counts = np.concatenate([self.counts,counts],axis=1).astype(np.int32)
+        data.checksums = checksums
+        data._init_views()
+        return data
+
+    def assigned(self,start=0,stop=None):
+        """
+        Boolean mask of the counties in rows start to stop which are actual
+        counties rather than the 'Out of XX' and 'Unassigned' entries
+        """
+        names = self.counties[start:stop]
+        return ~( np.char.startswith(names,'Out of') | (names == 'Unassigned') )
+
+    def county_population(self,start=0,stop=None):
+        """
+        Population of the actual counties (see assigned) in rows start to
+        stop, reporting those whose population is not known
+        """
+        keep = self.assigned(start, stop)
+        population = self.population[start:stop][keep]
+
+        missing = np.flatnonzero(population == counties.missing_population)
+        if missing.size > 0:
+            names  = self.counties[start:stop][keep]
+            codes  = self.state_index[start:stop][keep]
+            for i in missing:
+                print("Missing county data for {}, {}".format(
+                    names[i], self.state_codes[codes[i]]))
+
+        return population
+
+    def rows(self,state):
+        """Returns the range of matrix rows (start,stop) holding the given state"""
+        if state not in self.state_codes:
+            raise KeyError(state)
+        i = self.state_codes.index(state)
+        return self.state_offsets[i], self.state_offsets[i+1]
+
+def state_order(states):
+    """
+    Returns the state codes in the order they first appear in states, the
+    index into those codes of each entry of states and the (stable) order
+    which groups the entries by state, as used for the rows of a DataSet
+    """
+    state_codes = list(dict.fromkeys(states))
+
+    code_index  = { state:i for i,state in enumerate(state_codes) }
+    state_index = np.array([ code_index[state] for state in states ], dtype=np.int16)
+    order       = np.argsort(state_index, kind='stable')
+
+    return state_codes, state_index, order
+
+cache_dir   = 'data/jhu'
+derived_dir = 'data/derived'
+
+def cached_data(data_type,max_age):
+    """
+    Returns the cached DataSet if it is not older than max_age seconds
+    (None means it never expires), otherwise None
+    """
+    data = load_cache(data_type)
+    if data is None:
+        return None
+
+    ts = data.timestamp
+    if max_age is None or time.time() < ts + max_age:
+        print("Using cached " + data_type + " data from JHU downloaded at " + time.ctime(ts))
+    else:
+        data = None
 
-def cached_data(max_age):
-    now = time.time()
+    return data
+
+def load_cache(data_type):
+    """Returns the cached DataSet (regardless of its age) or None if there is none"""
     try:
-        data = pickle.load(open('data/jhu.np','rb'))
-        ts = data['timestamp']
-        if now < ts + max_age:
-            print("Using cached data from JHU downloaded at " + time.ctime(ts))
-        else:
-            data = None
+        data = DataSet.load(os.path.join(cache_dir,data_type))
     except Exception as x:
         data = None
 
     return data
 
-def cache_data(data):
+def cache_data(data_type,data):
     try:
-        data['timestamp'] = time.time()
-        pickle.dump(data,open('data/jhu.np','wb'))
-        print("Data cached to data/jhu.np for future use")
+        data.timestamp = time.time()
+        data.save(os.path.join(cache_dir,data_type))
+        print("Cached " + data_type + " data to " + cache_dir + " for future use")
     except:
-        print("Failed to cache data for future use")
+        print("Failed to cache " + data_type + " data for future use")
         pass
 
 
-def download_data(data_type):
+def download_data(data_type,cached=None,source=None):
+    """
+    Downloads the JHU time series for the given data type
 
-    url = '/'.join( ['https://raw.githubusercontent.com',
-                     'CSSEGISandData',
-                     'COVID-19',
-                     'master',
-                     'csse_covid_19_data',
-                     'csse_covid_19_time_series',
-                     '_'.join([ 'time_series_covid19',data_type,'US.csv'])
-                    ])
+    The file is fetched from the given source (see support.sources), which
+    defaults to the JHU github repository, and parsed while it is still
+    being downloaded (see parse_stream).  If the previously cached DataSet
+    is provided, the fetch is conditional on the file having changed since
+    it was cached, and the new date columns are appended to it unless any
+    of the earlier values were revised (see update_data).
+    """
+    if source is None:
+        source = sources.get_source()
 
-    rq = requests.get(url,stream=True)
+    validators = cached.validators if cached is not None else None
+    chunks, validators, size = source.open(data_type,validators)
 
-    if rq.status_code != 200:
-        raise IncorrectURL(url)
+    if chunks is None:
+        print("JHU " + data_type + " data has not changed since it was cached")
+        return cached
 
-    with closing(rq) as r:
-        f = ( line.decode('utf-8') for line in r.iter_lines() )
-        reader = csv.reader(f, delimiter=',',quotechar='"')
-        columns = next(reader)
-        dates = np.array(columns[56:])  # skip roughly first 2 months of data
+    data = parse_stream(chunks,cached,size,data_type,data_type in population_types)
+    data.validators = validators
 
-        nraw   = dates.size
-        ndays  = dates.size - 1
-        nweeks = int(ndays/7)
+    print("Using newly downloaded " + data_type + " data from JHU");
 
-        data = DataSet(dates)
+    return data
 
-        for row in reader:
-            if row[7] != 'US':
-                continue
+def download_all(data_types,cached,source=None,processes=True):
+    """
+    Downloads the JHU time series for several data types at once
+
+    Returns a dict of DataSet keyed by data type.  cached is a dict of the
+    previously cached DataSets (as used by download_data).
+
+    Each file is downloaded and parsed (see download_data) by its own
+    process, or by its own thread when there is only one CPU or processes
+    is False, so that the files are fetched concurrently.
+    """
+    import multiprocessing
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    if source is None:
+        source = sources.get_source()
+
+    nproc = min(len(data_types), os.cpu_count() or 1)
+    if processes and nproc > 1 and not multiprocessing.current_process().daemon:
+        with multiprocessing.get_context('fork').Pool(nproc) as pool:
+            data = { k : pool.apply_async(download_data,(k,cached.get(k),source))
+                     for k in data_types }
+            return { k : v.get() for k,v in data.items() }
+
+    with ThreadPoolExecutor(len(data_types)) as threads:
+        data = { k : threads.submit(download_data,k,cached.get(k),source)
+                 for k in data_types }
+        return { k : v.result() for k,v in data.items() }
+
+def parse_csv(text,cached=None):
+    """
+    Parses the text of a JHU time series CSV file into a DataSet
+
+    See parse_stream, which does the work.
+    """
+    return parse_stream([text.encode('utf-8')],cached)
+
+batch_bytes = 1<<20
+
+def parse_stream(chunks,cached=None,size=None,label=None,population=False):
+    """
+    Parses a JHU time series CSV file, given as chunks of bytes, into a
+    DataSet
+
+    The chunks are read ahead by a background thread while the rows are
+    parsed in batches of about batch_bytes, so that parsing overlaps with
+    the download.  The numeric block of date columns of each batch is read
+    by numpy's C parser into arrays allocated for the expected number of
+    rows (estimated from size, the expected number of bytes).  If a label
+    is given, the throughput is reported under that name.
+
+    The population of each county is taken from the Population column if
+    the file has one.  With population=True a file without it is an error
+    (ValueError).
+
+    If the previously cached DataSet is provided and the new file only adds
+    date columns to it, only those columns are parsed and appended to the
+    cached DataSet.  Whether any earlier value was revised is told by the
+    checksum of each row (see update_data), and if so the whole file is
+    parsed after all.
+    """
+    progress = ingest.Progress(label,size) if label else None
+    pieces   = ingest.batches(ingest.read_ahead(chunks, progress=progress), batch_bytes)
+
+    header, body = (next(pieces,b'').decode('utf-8').split('\n',1) + [''])[:2]
+    header = header.rstrip('\r')
+
+    columns = next(csv.reader([header], delimiter=',', quotechar='"'))
+    dates = su.parse_dates(columns[56:])  # skip roughly first 2 months of data
+    if 'Population' in columns:
+        population_column = columns.index('Population')
+    elif population:
+        raise ValueError("The JHU {} file has no Population column".format(label or 'time series'))
+    else:
+        population_column = None
+
+    update = cached is not None and cached.checksums is not None and extends(cached,dates)
+
+    def bodies(body):
+        while body is not None:
+            yield body
+            body = next(pieces,None)
+            body = body.decode('utf-8') if body is not None else None
+
+    if update:
+        texts = []
+        new   = dates.size - cached.dates.size
+        rows  = parse_rows(bodies(body), new, population_column, size, progress, new, texts)
+        data  = update_data(cached, dates, rows)
+        if data is not None:
+            return data
+        rows = parse_rows(texts, dates.size, population_column, size)
+    else:
+        rows = parse_rows(bodies(body), dates.size, population_column, size, progress)
+
+    fips, county, state = rows['fips'], rows['county'], list(rows['state'])
+
+    population = rows.get('population')
+    if population is None:
+        population = counties.population_by_fips(fips, county, state)
+
+    return DataSet(dates, state, county, rows['counts'], fips, population, rows['checksum'])
+
+def parse_rows(bodies,ncol,population_column=None,size=None,progress=None,new=None,texts=None):
+    """
+    Parses batches of rows of a JHU time series CSV file (see parse_body)
+
+    Returns a dict of the arrays of all rows.  If a list of texts is given,
+    the batches are also kept in it, so that they can be parsed again.
+    """
+    rows = None
+    for body in bodies:
+        if texts is not None:
+            texts.append(body)
+        if not body.strip():
+            continue
+
+        with profile.stage('parse'):
+            batch = parse_body(body, ncol, population_column, new)
+
+        if rows is None:
+            nline = max(1, body.count('\n'))
+            rows = ingest.Columns(int(1.05 * nline * (size or len(body)) / len(body)) + 1)
+
+        rows.append(**batch)
+
+        if progress is not None:
+            progress.parsed(len(batch['fips']))
+
+    if progress is not None:
+        progress.report()
+
+    if rows is None:
+        rows = dict(fips=np.zeros(0,np.int32), county=np.zeros(0,str), state=np.zeros(0,str),
+                    counts=np.zeros((0,ncol),np.int32), checksum=np.zeros(0,np.uint32))
+        if new is not None:
+            rows['cached'] = np.zeros(0,np.uint32)
+        return rows
+
+    return rows.arrays()
+
+def parse_body(body,ncol,population_column=None,new=None):
+    """
+    Parses the rows of a JHU time series CSV file
+
+    Returns a dict of the FIPS code, county name, state code, population
+    (if the index of the Population column is given) and CRC32 checksum of
+    the line of each US state row along with a matrix of the last ncol
+    columns of those rows.
+
+    If new is given, only the last new columns are parsed (ncol must be
+    new), and the checksum of each line without them (i.e. as it was when
+    the data was cached) is also returned, as 'cached'.  The population is
+    then left out, as it is unchanged if the checksums match.
+    """
+    lines = [ line for line in body.splitlines() if line ]
+
+    # FIPS, Admin2, Province_State and Country_Region come before the first
+    # quoted column (Combined_Key), so a plain split is enough for them
+    regions = np.array(
+        [ line.split(',',8)[4:8] for line in lines ],
+        dtype=str).reshape(-1,4)
+
+    fips, county, state, country = regions.T
+
+    keep = (country == 'US') & np.isin(state, list(states.us_state_abbrev))
+    kept = [ line for line,k in zip(lines,keep) if k ]
+
+    rval = dict(
+        fips   = np.where(fips == '', '0', fips)[keep].astype(float).astype(np.int32),
+        county = county[keep],
+        state  = np.array([ states.us_state_abbrev[x] for x in state[keep] ], dtype=str),
+    )
+
+    if new is None:
+        usecols = list(range(-ncol,0))
+        if population_column is not None:
+            usecols = [population_column] + usecols
+
+        counts = np.loadtxt(
+            io.StringIO(body), delimiter=',', quotechar='"',
+            usecols=usecols, dtype=np.int64 if population_column is not None else np.int32, ndmin=2)
+        counts = counts[keep]
+
+        if population_column is not None:
+            rval['population'] = counts[:,0]
+            counts = counts[:,1:]
+
+        rval['checksum'] = np.array([ zlib.crc32(line.encode()) for line in kept ], dtype=np.uint32)
+    else:
+        heads    = [ line.rsplit(',',new)[0] for line in kept ] if new else kept
+        cached   = [ zlib.crc32(head.encode()) for head in heads ]
+        checksum = [ zlib.crc32(line[len(head):].encode(), crc)
+                     for line,head,crc in zip(kept,heads,cached) ]
+
+        if new and kept:
+            tails  = [ line[len(head)+1:] for line,head in zip(kept,heads) ]
+            counts = np.loadtxt(
+                io.StringIO('\n'.join(tails)), delimiter=',', dtype=np.int32, ndmin=2)
+        else:
+            counts = np.zeros((len(kept),new), dtype=np.int32)
 
-            state = row[6]
-            if state not in states.us_state_abbrev: 
-                continue
+        rval['cached']   = np.array(cached, dtype=np.uint32)
+        rval['checksum'] = np.array(checksum, dtype=np.uint32)
 
-            state  = states.us_state_abbrev[state]
-            county = row[5]
+    rval['counts'] = counts
 
-            raw   = np.array(row[-nraw:],dtype=int)
-            daily = raw[1:] - raw[:-1]
+    return rval
 
-            weekly = raw[-1-7*nweeks::7]
-            weekly = weekly[1:] - weekly[:-1]
+def extends(cached,dates):
+    """True if the given dates start with those of the cached DataSet"""
+    nold = cached.dates.size
+    return dates.size >= nold and np.array_equal(dates[:nold], cached.dates)
 
-            data.raw.state.add(state,raw)
-            data.raw.county.add(state,county,raw)
+def update_data(cached,dates,rows):
+    """
+    Appends the new date columns of a JHU time series to a cached DataSet
 
-            data.daily.state.add(state,daily)
-            data.daily.county.add(state,county,daily)
+    rows holds the fips, county, state and counts (of the new dates only)
+    of the parsed rows, with the checksum of each line as it is now and
+    without the new columns ('cached').  JHU revises counts of any age, so
+    the latter must match the checksums of the cached rows, which also
+    covers the population and all of the earlier columns.  Returns None,
+    so that the caller does a full rebuild, if the rows do not line up
+    with the cache or if any of the earlier values were revised.
+    """
+    nold = cached.dates.size
 
-            data.weekly.state.add(state,weekly)
-            data.weekly.county.add(state,county,weekly)
+    state_codes, _, order = state_order(list(rows['state']))
 
-    print("Using newly downloaded " + data_type + " data from JHU");
+    if ( state_codes != cached.state_codes
+         or not np.array_equal(rows['county'][order], cached.counties)
+         or not np.array_equal(rows['fips'][order], cached.fips)
+         or not np.array_equal(rows['cached'][order], cached.checksums) ):
+        print("JHU data was revised, rebuilding from the full time series")
+        return None
 
-    return data
+    if dates.size == nold:
+        print("No new days in the JHU data, keeping the cached data")
+    else:
+        print("Appending {} new day(s) to the cached data".format(dates.size - nold))
 
+    return cached.extend(dates[nold:], rows['counts'][order], rows['checksum'][order])
@@ -0,0 +1,38 @@
+"""
+Functions for spreading independent plots across a pool of processes
+
+This file can be imported and contains the following functions:
+
+    * run - applies a function to a list of items, optionally in parallel
+
+The workers are forked from the calling process so that they inherit the
+JHU data (and anything else placed in the shared dict) without having to
+pickle it or load their own copy.
+"""
+
+shared = dict()
+
+
+def run(func, items, jobs=1, **kwargs):
+    """
+    Applies func to each item and returns the list of results (in order)
+
+    When jobs > 1 the items are spread across a pool of that many forked
+    processes.  Any keyword arguments are stored in the shared dict before
+    the pool is started so that the workers can find them there.
+
+    func must be a module level function (it is pickled by name).
+    """
+    import multiprocessing
+
+    shared.update(kwargs)
+
+    items = list(items)
+
+    if ( jobs is None or jobs <= 1 or len(items) <= 1
+         or multiprocessing.current_process().daemon ):
+        return [ func(x) for x in items ]
+
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(min(jobs,len(items))) as pool:
+        return pool.map(func, items, chunksize=1)
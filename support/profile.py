@@ -0,0 +1,133 @@
+"""
+Stage level timing and memory profile of a covidplot run
+
+This file can be imported and contains the following functions:
+
+    * stage  - context manager marking a named stage of the run
+    * enable - starts recording the stages (and optionally cProfile)
+    * report - prints a summary of the stages and writes the requested dump
+
+The stages are hooks in JHUData (cache load, download, parse, cache save,
+derive) and in the plotters (layout, draw, save).  They cost next to nothing
+unless profiling has been enabled by the -profile option.  The memory of a
+stage is measured with tracemalloc, which slows the run down somewhat.
+
+Stages that run in worker processes (e.g. -jobs, or the downloads when
+there are several CPUs) are not recorded.
+"""
+
+import atexit
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+enabled  = False
+records  = []
+output   = None
+profiler = None
+
+local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """Records the wall time and memory of the enclosed block as stage name"""
+    if not enabled:
+        yield
+        return
+
+    import tracemalloc
+
+    stack = local.__dict__.setdefault('stack', [])
+
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+    tracemalloc.reset_peak()
+
+    entry = dict(name=name, start=time.perf_counter(), memory=current, peak=current,
+                 tid=threading.get_ident())
+    stack.append(entry)
+    try:
+        yield
+    finally:
+        stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        entry['end']  = time.perf_counter()
+        entry['peak'] = max(entry['peak'], peak)
+        entry['net']  = current - entry['memory']
+        entry['peak'] -= entry['memory']
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], entry['peak'] + entry['memory'])
+        records.append(entry)
+
+
+def enable(filename=None):
+    """
+    Starts recording the stages, which are reported when the run exits
+
+    If filename ends in .json a Chrome trace-event file (for chrome://tracing
+    or Perfetto) is written to it, any other filename gets a cProfile dump
+    (for pstats or snakeviz).
+    """
+    global enabled, output, profiler
+
+    import tracemalloc
+
+    enabled = True
+    output  = filename or None
+    tracemalloc.start()
+
+    if output and not output.endswith('.json'):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    atexit.register(report)
+
+
+def report():
+    """Prints the time and memory of each stage and writes the dump (if any)"""
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(output)
+
+    if not records:
+        return
+
+    summary = dict()
+    for r in records:
+        s = summary.setdefault(r['name'], dict(count=0, seconds=0., peak=0, net=0))
+        s['count']   += 1
+        s['seconds'] += r['end'] - r['start']
+        s['peak']     = max(s['peak'], r['peak'])
+        s['net']     += r['net']
+
+    print("\nProfile of the run (stages may be nested):\n")
+    print("  {:14s} {:>6s} {:>10s} {:>10s} {:>10s}".format(
+        'stage', 'calls', 'time(s)', 'peak(MB)', 'net(MB)'))
+    for name, s in sorted(summary.items(), key=lambda x: -x[1]['seconds']):
+        print("  {:14s} {:6d} {:10.3f} {:10.1f} {:10.1f}".format(
+            name, s['count'], s['seconds'], s['peak']/1e6, s['net']/1e6))
+
+    if output and output.endswith('.json'):
+        write_trace(output)
+        print("\nTrace of the stages written to " + output)
+    elif output:
+        print("\ncProfile statistics written to " + output)
+
+
+def write_trace(filename):
+    """Writes the stages as complete events of the Chrome trace-event format"""
+    import json
+
+    start = min(r['start'] for r in records)
+    events = [ dict(name=r['name'], ph='X', pid=os.getpid(), tid=r['tid'],
+                    ts=1e6*(r['start']-start), dur=1e6*(r['end']-r['start']),
+                    args=dict(peak_mb=r['peak']/1e6, net_mb=r['net']/1e6))
+               for r in records ]
+
+    with open(filename,'w') as fp:
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), fp)
@@ -0,0 +1,177 @@
+"""
+Cache of rendered plots, keyed by everything that goes into them
+
+This file can be imported and contains the following functions:
+
+    * key   - digest of the parameters and input data of a plot
+    * reuse - saves a cached render of a plot instead of drawing it again
+    * store - adds a newly saved plot to the cache
+    * stats - reports how many plots were reused and rendered
+
+The key of a plot is a digest of the source of the plotter and of the
+drawing code the plotters share (the shared modules), the matplotlib
+version, the plot options and the arrays and texts the plotter draws.  So
+a plot is only drawn again when something it shows has changed, even
+though the default filenames change every day.  The saved plot is hard
+linked to the cached file (or copied where links are not possible).
+
+Renders that have not been used for max_unused seconds are removed.  The
+cache is not used for plots shown on screen or with -rerender.
+"""
+
+import glob
+import hashlib
+import numpy as np
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+path = 'data/renders'
+max_unused = 7*86400
+
+# support modules holding drawing code shared by the plotters
+shared = ['figures.py','states.py','util.py']
+
+# options which do not change the rendered plot
+ignored = ['saveas','save','show','max_age','source','memo','jobs','delay',
+           'importtime','profile','rerender','states']
+
+reused   = 0
+rendered = 0
+pruned   = False
+
+
+def key(args, *inputs):
+    """
+    Returns the cache key of the plot args.action draws from inputs (any
+    nesting of dicts, lists, arrays and scalars), or None if the plot
+    should not be cached
+    """
+    import matplotlib
+
+    if not args.save or args.show or getattr(args,'rerender',False):
+        return None
+
+    sha = hashlib.sha1()
+    sources = [ sys.modules['plotters.' + args.action].__file__ ]
+    sources += [ os.path.join(os.path.dirname(__file__), x) for x in shared ]
+    for source in sources:
+        with open(source,'rb') as fp:
+            sha.update(fp.read())
+    update(sha, matplotlib.__version__)
+    update(sha, { k : v for k,v in sorted(vars(args).items()) if k not in ignored })
+    for x in inputs:
+        update(sha, x)
+
+    return sha.hexdigest()
+
+
+def update(sha, x):
+    """Adds x to the digest sha"""
+    if isinstance(x,dict):
+        sha.update(b'{')
+        for k,v in x.items():
+            update(sha,k)
+            update(sha,v)
+        sha.update(b'}')
+    elif isinstance(x,(list,tuple)):
+        sha.update(b'[')
+        for v in x:
+            update(sha,v)
+        sha.update(b']')
+    elif isinstance(x,np.ndarray):
+        sha.update('{}{}'.format(x.dtype.str, x.shape).encode())
+        sha.update(np.ascontiguousarray(x).tobytes())
+    else:
+        sha.update(repr(x).encode())
+
+
+def reuse(render_key, filename):
+    """
+    Saves the cached render for render_key to filename (a name or a file
+    object) and returns True, or returns False if there is none
+
+    Otherwise any old file at filename is removed, as it may be linked to
+    another cached render which saving the new plot would overwrite.  So
+    this must only be called for plots that are about to be saved.
+    """
+    global reused
+
+    cached = None if render_key is None else os.path.join(path, render_key + '.png')
+
+    if cached is None or not os.path.exists(cached):
+        if isinstance(filename,str) and os.path.lexists(filename):
+            os.remove(filename)
+        return False
+
+    if isinstance(filename,str):
+        link(cached, filename)
+    else:
+        with open(cached,'rb') as fp:
+            filename.write(fp.read())
+    os.utime(cached)
+
+    reused += 1
+    print("Plot unchanged, reused for: {}".format(filename))
+    return True
+
+
+def store(render_key, filename):
+    """Adds the plot just saved to filename (a name or a buffer) to the cache"""
+    global rendered
+
+    if render_key is None:
+        return
+
+    os.makedirs(path, exist_ok=True)
+    prune()
+
+    cached = os.path.join(path, render_key + '.png')
+    if isinstance(filename,str):
+        link(filename, cached)
+    else:
+        fd, tmp = tempfile.mkstemp(dir=path, suffix='.tmp')
+        with os.fdopen(fd,'wb') as fp:
+            fp.write(filename.getvalue())
+        os.replace(tmp, cached)
+
+    rendered += 1
+
+
+def link(src, dst):
+    """Makes dst a hard link to src, or a copy of it where links fail"""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+
+    # a unique name, as other processes may be linking the same file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst) or '.', suffix='.tmp')
+    os.close(fd)
+    os.remove(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def prune():
+    """Removes the renders not used for max_unused seconds (once per run)"""
+    global pruned
+
+    if pruned:
+        return
+    pruned = True
+
+    cutoff = time.time() - max_unused
+    for cached in glob.glob(os.path.join(path, '*.png')):
+        try:
+            if os.path.getmtime(cached) < cutoff:
+                os.remove(cached)
+        except OSError:
+            pass
+
+
+def stats():
+    return "{} reused, {} rendered".format(reused, rendered)
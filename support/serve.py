@@ -0,0 +1,237 @@
+"""
+Render server which keeps the JHU data loaded and serves plots over HTTP
+
+This file can be imported and contains the following classes and functions:
+
+    * run          - loads the data, starts the worker processes and serves
+    * request_args - translates a request into command line arguments
+    * render       - renders one plot into PNG bytes (in a worker process)
+    * Server       - the HTTP server, holding the worker pool and the data
+
+A plot is requested by its action (and state), with the options of that
+action given as query parameters named like the command line options:
+
+    /map?deaths&percapita
+    /counties/NY?total&smooth=7
+    /states/CA?deaths&confirmed&kernel=centered
+    /stack?sort=total&descending
+    /heatmap?percapita&smooth=7&sort=peak
+
+/status returns the dates and age of the data being served (as JSON).
+
+The data sets (including the population of each county) are loaded, from
+the cache if there is one however old it is, and the plotters imported
+before the worker processes are forked.  So the workers start with
+everything in memory and keep their pooled figures and derived series
+from one request to the next.
+
+A background thread fetches the data again whenever it is older than
+-maxage (downloading with threads, as the server process must not fork
+once it is serving), while the requests are still served from the data
+they have.
+Once the new data has been cached, each worker reopens it (memory-mapped)
+on its next request.
+"""
+
+import io
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+from contextlib import redirect_stdout, redirect_stderr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from urllib.parse import urlsplit, parse_qsl
+
+import support.args
+import support.jhu_data as jhu
+
+actions    = ['map','counties','states','stack','heatmap']
+with_state = ['counties','states']
+
+# options which are up to the server rather than the request
+reserved = ['save','show','reload','source','memo','jobs','delay','profile','importtime']
+
+min_interval   = 60     # shortest time (seconds) between two refreshes
+retry_interval = 300    # time before a failed refresh is tried again
+
+# data of a worker process and the generation (refresh) it belongs to
+worker = dict(jhu_data=None, generation=0)
+
+
+def run(args):
+    """Serves plots on args.host:args.port until interrupted"""
+    import multiprocessing
+
+    jhu_data = jhu.JHUData(float('inf'), args.source, args.memo)
+    jhu_data.load()
+
+    for action in actions:
+        import_module('plotters.' + action)
+
+    worker['jhu_data'] = jhu_data
+    jobs = args.jobs or os.cpu_count() or 1
+
+    # the workers are forked before the server opens its socket, so they do not hold the port
+    pool = multiprocessing.get_context('fork').Pool(jobs)
+    try:
+        try:
+            server = Server((args.host, args.port), pool, jhu_data)
+        except OSError as e:
+            print("\nCannot serve on {}:{} ({})\n".format(args.host, args.port, e.strerror or e))
+            sys.exit(1)
+
+        thread = threading.Thread(target=refresh, args=(server,args), daemon=True)
+        thread.start()
+
+        print("Serving plots on http://{}:{}/ with {} worker(s)".format(
+            args.host, server.server_port, jobs))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        pool.terminate()
+
+
+def refresh(server, args):
+    """Fetches the data again each time it gets older than args.max_age"""
+    interval = max(args.max_age, min_interval)
+    due = min( x.timestamp for x in server.jhu_data.values() ) + interval
+
+    while True:
+        time.sleep(max(due - time.time(), 0))
+        try:
+            # threads only, forking beside the request threads could deadlock
+            jhu_data = jhu.JHUData(0, args.source, args.memo, processes=False)
+            jhu_data.load()
+        except Exception as e:
+            print("Failed to refresh the JHU data ({}), trying again in {}s".format(
+                e, retry_interval))
+            due = time.time() + retry_interval
+            continue
+
+        server.jhu_data = jhu_data
+        server.generation += 1
+        due = time.time() + interval
+
+
+def request_args(path, query):
+    """
+    Returns the command line arguments for a request, e.g. ['counties',
+    'NY', '-total', '-smooth=7'] for /counties/NY?total&smooth=7, or None
+    if the path is not that of a plot
+
+    Raises ValueError for the options which cannot be set by a request.
+    """
+    argv = [ x for x in path.split('/') if x ]
+    if not argv or argv[0] not in actions:
+        return None
+    if len(argv) != (2 if argv[0] in with_state else 1):
+        return None
+
+    for k,v in parse_qsl(query, keep_blank_values=True):
+        # argparse accepts abbreviations, so reject those of reserved options too
+        if not k.isalpha() or any( x.startswith(k) for x in reserved ):
+            raise ValueError("Option not allowed: " + k)
+        argv.append('-' + k + ('=' + v if v else ''))
+
+    return argv
+
+
+def render(argv, generation):
+    """
+    Renders the plot given by the command line arguments argv and returns
+    the HTTP status and body of the response (the PNG or an error message)
+
+    Runs in a worker process, which first reopens the cached data if it
+    has been refreshed (generation) since the worker last used it.
+    """
+    import matplotlib.pyplot as plt
+
+    if generation != worker['generation']:
+        old = worker['jhu_data']
+        worker['jhu_data'] = jhu.JHUData(float('inf'), old.source, old.derived.path is not None)
+        worker['generation'] = generation
+
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            args = support.args.Args(argv + ['-save'])
+            args.show   = False
+            args.saveas = io.BytesIO()
+            import_module('plotters.' + args.action).plot(args, worker['jhu_data'])
+        return 200, args.saveas.getvalue()
+    except SystemExit:
+        return 400, output.getvalue().encode('utf-8')
+    except Exception:
+        return 500, traceback.format_exc().encode('utf-8')
+    finally:
+        plt.close('all')
+
+
+class Server(ThreadingHTTPServer):
+    """
+    HTTP server which hands each plot to a pool of worker processes
+
+    Attributes:
+        pool       - the pool of worker processes
+        jhu_data   - the JHUData being served
+        generation - number of times the data has been refreshed
+    """
+    daemon_threads = True
+
+    def __init__(self,address,pool,jhu_data):
+        super().__init__(address, Handler)
+        self.pool       = pool
+        self.jhu_data   = jhu_data
+        self.generation = 0
+
+    def render(self,argv):
+        return self.pool.apply(render, (argv, self.generation))
+
+    def status(self):
+        data = dict()
+        for k,v in self.jhu_data.items():
+            data[k] = dict(
+                first    = str(v.dates[0]),
+                last     = str(v.dates[-1]),
+                counties = len(v.counties),
+                fetched  = time.ctime(v.timestamp))
+        return dict(generation=self.generation, data=data)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+
+        if url.path == '/status':
+            body = json.dumps(self.server.status(), indent=2).encode('utf-8')
+            self.respond(200, body, 'application/json')
+            return
+
+        try:
+            argv = request_args(url.path, url.query)
+        except ValueError as e:
+            self.respond(400, str(e).encode('utf-8'))
+            return
+
+        if argv is None:
+            self.respond(404, b"Plots are /map, /stack, /heatmap, /counties/XX and /states/XX\n")
+            return
+
+        status, body = self.server.render(argv)
+        self.respond(status, body, 'image/png' if status == 200 else None)
+
+    def respond(self,status,body,content_type=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type or 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
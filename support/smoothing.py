@@ -0,0 +1,102 @@
+"""
+Collection of functions for smoothing time series
+
+This file can be imported and contains the following functions:
+
+    * smooth  - smooths every row of a (regions x days) array in one pass
+    * trimmed - number of days dropped from each end of the smoothed series
+
+Supported kernels:
+
+    * trailing    - average of the window ending on each day (the default)
+    * centered    - average of the window centered on each day
+    * exponential - exponentially weighted average with alpha = 2/(window+1)
+"""
+
+import numpy as np
+
+kernels = ['trailing','centered','exponential']
+
+
+def smooth(data, window, kernel='trailing'):
+    """
+    Smooths each row of data (a 1-D series or a 2-D regions x days array)
+
+    The result has window-1 fewer columns than data.  For the trailing and
+    centered kernels it equals np.convolve(row, np.ones(window)/window,
+    mode='valid') on each row.  Up to exact_window days the shifted columns
+    are summed in the same order as numpy's dot product, which gives the
+    same bits.  Beyond that numpy sums in a different order, so the rows
+    are passed to np.convolve one at a time.  The two kernels only differ
+    in the dates the values are assigned to (see trimmed).
+
+    The trailing and centered kernels process the rows in blocks of
+    chunk_rows so that the working set stays in cache.
+    """
+    if window is None or window <= 1:
+        return data
+
+    if kernel not in kernels:
+        raise ValueError("Unknown smoothing kernel: " + str(kernel))
+
+    data = np.asarray(data)
+    rows = data.reshape(-1, data.shape[-1])
+    n    = rows.shape[1] - window + 1
+
+    if kernel == 'exponential':
+        rval = _exponential(rows, window)
+    elif window > exact_window:
+        c    = np.ones(window)/window
+        rval = np.array([ np.convolve(row, c, mode='valid') for row in rows ])
+        rval = rval.reshape(rows.shape[0], n)
+    else:
+        rval = np.empty((rows.shape[0], n))
+        for start in range(0, rows.shape[0], chunk_rows):
+            block = rows[start:start+chunk_rows].astype(float)
+            _uniform(block, window, rval[start:start+chunk_rows])
+
+    return rval.reshape(data.shape[:-1] + (n,))
+
+
+chunk_rows = 64
+
+# longest window for which _uniform gives the same bits as np.convolve
+exact_window = 11
+
+
+def _uniform(block, window, out):
+    # Every weight is the same, so each value only needs to be scaled once
+    n = out.shape[1]
+    c = np.ones(window)/window
+
+    block *= c[0]
+    out[:] = block[:,0:n]
+    for k in range(1, window):
+        out += block[:,k:k+n]
+
+
+def _exponential(rows, window):
+    # Steps through the days with all of the regions at once, using a
+    # (days x regions) copy so that each day is contiguous
+    alpha = 2. / (window + 1)
+
+    cols = np.ascontiguousarray(rows.T, dtype=float)
+    for i in range(1, cols.shape[0]):
+        cols[i] *= alpha
+        cols[i] += (1-alpha)*cols[i-1]
+
+    return cols[window-1:].T.copy()
+
+
+def trimmed(window, kernel='trailing'):
+    """
+    Returns the number of dates (first, last) dropped from the start and
+    end of a series by smooth so that the dates line up with its values
+    """
+    if window is None or window <= 1:
+        return 0, 0
+
+    if kernel == 'centered':
+        return (window-1)//2, window//2
+
+    return window-1, 0
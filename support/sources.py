@@ -0,0 +1,147 @@
+"""
+Sources of the JHU time series files
+
+This file can be imported and contains the following functions:
+
+    * get_source - returns the source for a URL, directory or file pattern
+
+Each source provides an open method which takes the data type (deaths or
+confirmed) and the validators returned by a previous fetch.  It returns
+an iterator over the bytes of the CSV file (in chunks, as they arrive),
+the new validators and the expected size of the file (None if unknown).
+The iterator is None if the file has not changed since the validators
+were obtained.  The fetch method returns the whole text of the file
+instead of the iterator.
+"""
+
+import os
+
+from contextlib import closing
+
+jhu_url = '/'.join( ['https://raw.githubusercontent.com',
+                     'CSSEGISandData',
+                     'COVID-19',
+                     'master',
+                     'csse_covid_19_data',
+                     'csse_covid_19_time_series'
+                    ])
+
+class IncorrectURL(Exception):
+    pass
+
+def csv_name(data_type):
+    return '_'.join([ 'time_series_covid19',data_type,'US.csv'])
+
+def get_source(location=None):
+    """
+    Returns the source for the given location
+
+    The location may be an http(s) URL of the directory holding the JHU
+    files (the JHU github repository by default), a local directory (or
+    file:// URL) holding a mirror of the files, or a file name pattern
+    containing {data_type}.
+    """
+    if location is None:
+        location = jhu_url
+
+    if location.startswith('http://') or location.startswith('https://'):
+        return HTTPSource(location)
+
+    if location.startswith('file://'):
+        location = location[len('file://'):]
+
+    return FileSource(location)
+
+chunk_size = 1<<16
+
+class Source:
+    """Base class of the sources, provides fetch on top of open"""
+
+    def fetch(self,data_type,validators=None):
+        chunks, validators, _ = self.open(data_type,validators)
+        if chunks is None:
+            return None, validators
+        return b''.join(chunks).decode('utf-8'), validators
+
+class HTTPSource(Source):
+    """
+    JHU files served over http(s)
+
+    The ETag and Last-Modified headers of the response are returned as the
+    validators and sent back on the next fetch as a conditional request.
+    """
+    def __init__(self,url):
+        self.location = url.rstrip('/')
+
+    def open(self,data_type,validators=None):
+        import requests
+
+        url = '/'.join([self.location,csv_name(data_type)])
+
+        headers = dict()
+        if validators and validators.get('source') == self.location:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        rq = requests.get(url,headers=headers,stream=True)
+
+        if rq.status_code != 200:
+            rq.close()
+            if rq.status_code == 304:
+                return None, validators, None
+            raise IncorrectURL(url)
+
+        validators = {
+            'source'        : self.location,
+            'etag'          : rq.headers.get('ETag'),
+            'last_modified' : rq.headers.get('Last-Modified'),
+        }
+
+        # the length of a compressed response is only a lower bound
+        size = rq.headers.get('Content-Length')
+        size = int(size) if size is not None else None
+
+        def chunks():
+            with closing(rq):
+                yield from rq.iter_content(chunk_size)
+
+        return chunks(), validators, size
+
+class FileSource(Source):
+    """
+    JHU files in a local directory (or matching a {data_type} file pattern)
+
+    The modification time and size of the file are used as the validators.
+    """
+    def __init__(self,path):
+        self.location = path
+
+    def path(self,data_type):
+        if '{data_type}' in self.location:
+            return self.location.format(data_type=data_type)
+        return os.path.join(self.location,csv_name(data_type))
+
+    def open(self,data_type,validators=None):
+        path = self.path(data_type)
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            raise IncorrectURL(path)
+
+        new_validators = {
+            'source' : self.location,
+            'mtime'  : st.st_mtime_ns,
+            'size'   : st.st_size,
+        }
+
+        if validators == new_validators:
+            return None, validators, None
+
+        def chunks():
+            with open(path,'rb') as fp:
+                yield from iter(lambda: fp.read(chunk_size), b'')
+
+        return chunks(), new_validators, st.st_size
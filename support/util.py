@@ -3,17 +3,56 @@ Collection of utililty functions that support multiple plot scripts
 
 This file can be imported and contains the following functions:
 
-    * y_ticks   - computes aesthetically pleasing y-axis tick marks
+    * use_backend - selects the matplotlib backend before pyplot is imported
+    * parse_dates - converts JHU date strings to a datetime64 array
+    * date_labels - converts a datetime64 array to JHU date strings
+    * x_values    - returns the dates of a series for plotting
+    * timespan    - returns the first and last date of a series
+    * y_ticks     - computes aesthetically pleasing y-axis tick marks
+    * write_file  - writes a file under a unique temporary name and moves it into place
 """
 
 import math
 import numpy as np
-from datetime import datetime
+import os
+import tempfile
 
 
+def use_backend(show):
+    """
+    Selects matplotlib's non-interactive Agg backend unless the plots are
+    to be shown on screen, so that saving plots never starts a GUI toolkit
+
+    Must be called before matplotlib.pyplot is imported
+    """
+    if not show:
+        import matplotlib
+        matplotlib.use('Agg')
+
+
+def parse_dates(dates):
+    """
+    Converts date strings in the JHU format (m/d/yy) to a numpy
+    datetime64[D] array
+    """
+    iso = []
+    for d in dates:
+        m, d, y = d.split('/')
+        iso.append('20{}-{:0>2}-{:0>2}'.format(y[-2:], m, d))
+    return np.array(iso, dtype='datetime64[D]')
+
+def date_labels(dates):
+    """Converts a datetime64[D] array to date strings in the JHU format (m/d/yy)"""
+    days   = dates.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years  = months.astype('datetime64[Y]').astype(int) + 1970
+    return [ f'{m}/{d}/{y%100}' for m,d,y in zip(
+        months.astype(int) % 12 + 1, (days - months).astype(int) + 1, years) ]
+
 def x_values(dates):
     """
-    Converts a list of date strings to datetime dates
+    Returns the dates as a datetime64[D] array (which matplotlib plots
+    directly), converting date strings (see parse_dates) if necessary
 
     If multiplt lists are provided (via dict), the conversion will
     be applied to all lists and returned in a dictionary with the
@@ -21,29 +60,28 @@ def x_values(dates):
     """
     if isinstance(dates,dict):
         return { k:x_values(v) for k,v in dates.items() }
-    else:
-        return [ datetime.strptime(d,"%m/%d/%y").date() for d in dates ]
+
+    dates = np.asarray(dates)
+    if dates.dtype.kind in 'US':
+        return parse_dates(dates)
+    return dates.astype('datetime64[D]',copy=False)
 
 def timespan(dates):
     """
-    Converts a list of date strings to a timespan
+    Returns the first and last of the dates (a datetime64 array, or a list
+    of date strings) formatted as dd-Mon-yy
 
     If multiplt lists are provided (via dict), the returned timespan
     will be based on the union of the lists
     """
     if isinstance(dates,dict):
-        rval = [
-            min( [ datetime.strptime(d[ 0],"%m/%d/%y").date() for d in dates.values() ] ),
-            max( [ datetime.strptime(d[-1],"%m/%d/%y").date() for d in dates.values() ] )
-        ]
-
+        dates = [ x_values(v) for v in dates.values() ]
+        rval  = [ min(d[0] for d in dates), max(d[-1] for d in dates) ]
     else:
-        rval = [
-            datetime.strptime(dates[ 0],"%m/%d/%y").date(),
-            datetime.strptime(dates[-1],"%m/%d/%y").date(),
-        ]
+        dates = x_values(dates)
+        rval  = [ dates[0], dates[-1] ]
 
-    rval = [ dt.strftime("%d-%b-%y") for dt in rval ]
+    rval = [ dt.astype(object).strftime("%d-%b-%y") for dt in rval ]
 
     return rval
 
@@ -81,3 +119,22 @@ def y_ticks(max_y):
     n_y = 2 + int(sf*max_y/d_y)
 
     return [x * d_y for x in range(0, n_y)], sf
+
+
+def write_file(filename, write, mode='wb'):
+    """
+    Calls write(fp) with a file object for a uniquely named temporary file
+    in the directory of filename, then moves it to filename
+
+    So processes writing the same file at once never share a temporary
+    file, and readers only ever see a complete file.
+    """
+    directory, name = os.path.split(filename)
+    fd, tmp = tempfile.mkstemp(dir=directory or '.', prefix='.' + name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as fp:
+            write(fp)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise